@@ -1,80 +1,194 @@
 import base64
-import tkinter as tk
-from tkinter import messagebox, filedialog
-from Crypto.Cipher import AES
-from Crypto.Protocol.KDF import PBKDF2
-from Crypto.Random import get_random_bytes
+import os
+import queue
 import random
-import struct
-import hashlib
+import threading
+import tkinter as tk
+from tkinter import messagebox, filedialog, ttk
+
+# Логика шифрования общая с ботом (cipher_logic.py рядом со скриптом)
+from cipher_logic import AESGCMCipher, calculate_iterations_from_password, MIN_ITERATIONS, MAX_ITERATIONS
+
+# ================== Фоновое выполнение ==================
+
+# Как часто главный поток забирает события от фонового потока (мс)
+POLL_INTERVAL_MS = 100
+
+class OperationCancelled(Exception):
+    """Операция прервана пользователем."""
+
 
-# ================== Класс шифрования ==================
+# События фонового потока: ('progress', done, total), ('done', callback, result),
+# ('error', title, exception), ('cancelled', None, None)
+worker_events = queue.Queue()
+cancel_event = threading.Event()
+worker_thread = None
 
-# Функция для вычисления детерминированного числа итераций из пароля
-def calculate_iterations_from_password(password: str, iterations_password: str) -> int:
+
+def check_cancelled():
     """
-    Вычисляет количество итераций на основе хеша связки двух паролей.
-    Если второй пароль пуст, используется только основной.
+    Прерывает фоновую операцию, если нажата «Отмена». Вызывается только до того, как
+    результат записан: после переименования файла операция считается выполненной.
     """
-    combined_password = password + iterations_password
-    hash_value = hashlib.sha256(combined_password.encode('utf-8')).digest()
-    hash_int = struct.unpack('>I', hash_value[:4])[0]
-    
-    min_iter = 5000000
-    max_iter = 6000000
-    
-    iterations = min_iter + (hash_int % (max_iter - min_iter + 1))
-    return iterations
+    if cancel_event.is_set():
+        raise OperationCancelled()
+
+
+def report_progress(done: int, total: int):
+    """Вызывается из фонового потока после каждого блока данных."""
+    check_cancelled()
+    worker_events.put(('progress', done, total))
 
-class AESGCMCipher:
-    def __init__(self, password, iterations_password=""):
-        self.password = password.encode('utf-8')
-        self.iterations_password = iterations_password.encode('utf-8')
 
-    def encrypt(self, data: bytes, iterations: int) -> bytes:
-        salt = get_random_bytes(16)
-        key = PBKDF2(self.password, salt, dkLen=32, count=iterations)
+def run_in_background(title: str, job, on_success):
+    """
+    Выполняет job(progress) в фоновом потоке, чтобы окно не зависало на PBKDF2
+    и чтении файлов. on_success(result) вызывается уже в главном потоке Tk.
+    """
+    global worker_thread
+    if worker_thread and worker_thread.is_alive():
+        messagebox.showwarning("Подождите", "Предыдущая операция ещё выполняется")
+        return
+
+    cancel_event.clear()
+    set_busy(True, title)
+
+    def target():
+        try:
+            result = job(report_progress)
+            worker_events.put(('done', on_success, result))
+        except OperationCancelled:
+            worker_events.put(('cancelled', None, None))
+        except Exception as e:
+            worker_events.put(('error', title, e))
+
+    worker_thread = threading.Thread(target=target, daemon=True)
+    worker_thread.start()
+    root.after(POLL_INTERVAL_MS, poll_worker)
 
-        cipher = AES.new(key, AES.MODE_GCM)
-        ciphertext, tag = cipher.encrypt_and_digest(data)
-        
-        return salt + cipher.nonce + ciphertext + tag
 
-    def decrypt(self, packet: bytes, decrypt_iterations: int) -> bytes:
+def poll_worker():
+    """Забирает события фонового потока в главном потоке (через root.after)."""
+    while True:
         try:
-            salt = packet[:16]
-            nonce = packet[16:32]
-            ciphertext = packet[32:-16]
-            tag = packet[-16:]
-            
-            key = PBKDF2(self.password, salt, dkLen=32, count=decrypt_iterations)
-            
-            cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
-            plaintext = cipher.decrypt_and_verify(ciphertext, tag)
-            return plaintext
-        except ValueError as e:
-            # Если не удалось, пробуем с вычисленным из пароля количеством итераций
-            try:
-                iterations = calculate_iterations_from_password(
-                    self.password.decode('utf-8'),
-                    self.iterations_password.decode('utf-8')
-                )
-                
-                salt = packet[:16]
-                nonce = packet[16:32]
-                ciphertext = packet[32:-16]
-                tag = packet[-16:]
-                
-                key = PBKDF2(self.password, salt, dkLen=32, count=iterations)
-
-                cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
-                plaintext = cipher.decrypt_and_verify(ciphertext, tag)
-                return plaintext
-            except ValueError:
-                raise ValueError("Ошибка расшифрования: повреждённые данные или неверный пароль") from e
+            kind, first, second = worker_events.get_nowait()
+        except queue.Empty:
+            break
+
+        if kind == 'progress':
+            done, total = first, second
+            if total:
+                if str(progress_bar['mode']) != 'determinate':
+                    progress_bar.stop()
+                    progress_bar.config(mode='determinate', maximum=total)
+                progress_bar['value'] = done
+                status_label.config(text=f"{status_title}: {done * 100 // total}%")
+            continue
+
+        set_busy(False)
+        if kind == 'done':
+            first(second)
+        elif kind == 'cancelled':
+            messagebox.showinfo("Отмена", "Операция отменена")
+        else:
+            messagebox.showerror("Ошибка", f"{first}: {second}")
+        return
+
+    root.after(POLL_INTERVAL_MS, poll_worker)
+
+
+def cancel_operation():
+    # PBKDF2 прервать нельзя: отмена сработает после вывода ключа, на ближайшем блоке
+    cancel_event.set()
+    status_label.config(text=f"{status_title}: отмена...")
+
+
+def set_busy(busy: bool, title: str = ""):
+    global status_title
+    status_title = title
+    state = tk.DISABLED if busy else tk.NORMAL
+    for button in action_buttons:
+        button.config(state=state)
+    cancel_button.config(state=tk.NORMAL if busy else tk.DISABLED)
+
+    progress_bar.stop()
+    if busy:
+        # Пока выводится ключ, прогресс неизвестен
+        progress_bar.config(mode='indeterminate', value=0)
+        progress_bar.start(10)
+        status_label.config(text=f"{title}: вывод ключа...")
+    else:
+        progress_bar.config(mode='determinate', value=0)
+        status_label.config(text="Готово")
+
+
+def replace_when_done(save_path: str, write_job):
+    """
+    Пишет результат во временный файл рядом с save_path и переименовывает его
+    только после успешного завершения (в том числе проверки тега GCM).
+    Отмена проверяется последний раз перед переименованием.
+    """
+    temp_path = save_path + ".part"
+    try:
+        with open(temp_path, 'wb') as f_out:
+            result = write_job(f_out)
+        check_cancelled()
+        os.replace(temp_path, save_path)
+        return result
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
 
 
 # ================== GUI Функции ==================
+
+def read_encrypt_iterations(password: str, iterations_password: str):
+    """Итерации для шифрования из полей ввода. None - ошибка (уже показана)."""
+    try:
+        if iterations_password.strip() != "":
+            return calculate_iterations_from_password(password, iterations_password)
+        if encrypt_iter_entry.get().strip() == "":
+            return random.randint(MIN_ITERATIONS, MAX_ITERATIONS)
+        iterations = int(encrypt_iter_entry.get())
+    except ValueError:
+        messagebox.showerror("Ошибка", "Количество итераций для шифрования должно быть числом!")
+        return None
+    if iterations < MIN_ITERATIONS:
+        messagebox.showerror("Ошибка", "Количество итераций для шифрования должно быть не менее 5 000 000!")
+        return None
+    return iterations
+
+
+def read_decrypt_iterations():
+    """Итерации для первой попытки расшифровки. None - ошибка (уже показана)."""
+    if decrypt_iter_entry.get().strip() == "":
+        return 100000
+    try:
+        return int(decrypt_iter_entry.get())
+    except ValueError:
+        messagebox.showerror("Ошибка", "Количество итераций для расшифровки должно быть числом!")
+        return None
+
+
+def encryption_cipher(password: str, iterations_password: str) -> AESGCMCipher:
+    # Пароль для итераций из одних пробелов GUI всегда считал пустым
+    return AESGCMCipher(password, iterations_password if iterations_password.strip() else "")
+
+
+def show_iterations(iterations: int):
+    iterations_result_text.config(state=tk.NORMAL)
+    iterations_result_text.delete("1.0", tk.END)
+    iterations_result_text.insert(tk.END, str(iterations))
+    iterations_result_text.config(state=tk.DISABLED)
+
+
+def show_result(text: str):
+    result_text.config(state=tk.NORMAL)
+    result_text.delete("1.0", tk.END)
+    result_text.insert(tk.END, text)
+    result_text.config(state=tk.DISABLED)
+
+
 def encrypt_text():
     password = key_entry.get()
     iterations_password = iterations_key_entry.get()
@@ -84,40 +198,26 @@ def encrypt_text():
         messagebox.showerror("Ошибка", "Введите пароль и текст!")
         return
 
-    try:
-        iterations = 0
-        if iterations_password.strip() != "":
-            iterations = calculate_iterations_from_password(password, iterations_password)
-        else:
-            if encrypt_iter_entry.get().strip() == "":
-                iterations = random.randint(5000000, 6000000)
-            else:
-                iterations = int(encrypt_iter_entry.get())
-                if iterations < 5000000:
-                    messagebox.showerror("Ошибка", "Количество итераций для шифрования должно быть не менее 5 000 000!")
-                    return
-    except ValueError:
-        messagebox.showerror("Ошибка", "Количество итераций для шифрования должно быть числом!")
+    iterations = read_encrypt_iterations(password, iterations_password)
+    if iterations is None:
         return
 
-    try:
-        cipher = AESGCMCipher(password, iterations_password)
-        encrypted_data = cipher.encrypt(text.encode('utf-8'), iterations)
-
-        result_text.config(state=tk.NORMAL)
-        result_text.delete("1.0", tk.END)
-        result_text.insert(tk.END, base64.b64encode(encrypted_data).decode('utf-8'))
-        result_text.config(state=tk.DISABLED)
-        
-        # Обновляем поле с итерациями
-        iterations_result_text.config(state=tk.NORMAL)
-        iterations_result_text.delete("1.0", tk.END)
-        iterations_result_text.insert(tk.END, str(iterations))
-        iterations_result_text.config(state=tk.DISABLED)
+    cipher = encryption_cipher(password, iterations_password)
+
+    def job(progress):
+        encrypted_data, used_iterations = cipher.encrypt(text.encode('utf-8'), iterations)
+        # Текст шифруется целиком, поэтому отмена во время PBKDF2 учитывается здесь
+        check_cancelled()
+        return base64.b64encode(encrypted_data).decode('utf-8'), used_iterations
 
+    def done(result):
+        encoded, used_iterations = result
+        show_result(encoded)
+        # Обновляем поле с итерациями
+        show_iterations(used_iterations)
         messagebox.showinfo("Успех", "Текст зашифрован и отображён в поле «Результат»")
-    except Exception as e:
-        messagebox.showerror("Ошибка", f"Не удалось зашифровать: {e}")
+
+    run_in_background("Шифрование текста", job, done)
 
 
 def decrypt_text():
@@ -131,29 +231,26 @@ def decrypt_text():
 
     try:
         encrypted_data = base64.b64decode(text)
-        
-        decrypt_iterations = 0
-        if decrypt_iter_entry.get().strip() == "":
-            decrypt_iterations = 100000
-        else:
-            try:
-                decrypt_iterations = int(decrypt_iter_entry.get())
-            except ValueError:
-                messagebox.showerror("Ошибка", "Количество итераций для расшифровки должно быть числом!")
-                return
-
-        cipher = AESGCMCipher(password, iterations_password)
-        decrypted_data = cipher.decrypt(encrypted_data, decrypt_iterations)
-        
-        decrypted_text = decrypted_data.decode('utf-8')
-
-        result_text.config(state=tk.NORMAL)
-        result_text.delete("1.0", tk.END)
-        result_text.insert(tk.END, decrypted_text)
-        result_text.config(state=tk.DISABLED)
-        messagebox.showinfo("Успех", "Текст успешно расшифрован и отображён в поле «Результат»")
-    except Exception as e:
+    except ValueError as e:
         messagebox.showerror("Ошибка", f"Не удалось расшифровать: {e}")
+        return
+
+    decrypt_iterations = read_decrypt_iterations()
+    if decrypt_iterations is None:
+        return
+
+    cipher = AESGCMCipher(password, iterations_password)
+
+    def job(progress):
+        decrypted = cipher.decrypt(encrypted_data, decrypt_iterations).decode('utf-8')
+        check_cancelled()
+        return decrypted
+
+    def done(decrypted_text):
+        show_result(decrypted_text)
+        messagebox.showinfo("Успех", "Текст успешно расшифрован и отображён в поле «Результат»")
+
+    run_in_background("Расшифрование текста", job, done)
 
 
 def encrypt_file():
@@ -163,23 +260,10 @@ def encrypt_file():
         messagebox.showerror("Ошибка", "Введите пароль!")
         return
     
-    try:
-        iterations = 0
-        if iterations_password.strip() != "":
-            iterations = calculate_iterations_from_password(password, iterations_password)
-        else:
-            if encrypt_iter_entry.get().strip() == "":
-                iterations = random.randint(5000000, 6000000)
-            else:
-                iterations = int(encrypt_iter_entry.get())
-                if iterations < 5000000:
-                    messagebox.showerror("Ошибка", "Количество итераций для шифрования должно быть не менее 5 000 000!")
-                    return
-    except ValueError:
-        messagebox.showerror("Ошибка", "Количество итераций для шифрования должно быть числом!")
+    iterations = read_encrypt_iterations(password, iterations_password)
+    if iterations is None:
         return
 
-
     file_path = filedialog.askopenfilename(title="Выберите файл для шифрования")
     if not file_path:
         return
@@ -188,25 +272,21 @@ def encrypt_file():
     if not save_path:
         return
 
-    try:
-        cipher = AESGCMCipher(password, iterations_password)
-        with open(file_path, 'rb') as f_in:
-            data = f_in.read()
-        
-        encrypted_data = cipher.encrypt(data, iterations)
+    cipher = encryption_cipher(password, iterations_password)
 
-        with open(save_path, 'wb') as f_out:
-            f_out.write(encrypted_data)
+    def job(progress):
+        # Файл читается и шифруется блоками - память не зависит от размера файла
+        with open(file_path, 'rb') as f_in:
+            return replace_when_done(
+                save_path, lambda f_out: cipher.encrypt_stream(f_in, f_out, iterations, progress)
+            )
 
+    def done(used_iterations):
         # Обновляем поле с итерациями
-        iterations_result_text.config(state=tk.NORMAL)
-        iterations_result_text.delete("1.0", tk.END)
-        iterations_result_text.insert(tk.END, str(iterations))
-        iterations_result_text.config(state=tk.DISABLED)
-
+        show_iterations(used_iterations)
         messagebox.showinfo("Успех", "Файл успешно зашифрован!")
-    except Exception as e:
-        messagebox.showerror("Ошибка", f"Не удалось зашифровать файл: {e}")
+
+    run_in_background("Шифрование файла", job, done)
 
 
 def decrypt_file():
@@ -216,6 +296,10 @@ def decrypt_file():
         messagebox.showerror("Ошибка", "Введите пароль!")
         return
 
+    decrypt_iterations = read_decrypt_iterations()
+    if decrypt_iterations is None:
+        return
+
     file_path = filedialog.askopenfilename(title="Выберите файл для расшифрования")
     if not file_path:
         return
@@ -224,29 +308,19 @@ def decrypt_file():
     if not save_path:
         return
 
-    try:
-        with open(file_path, 'rb') as f_in:
-            encrypted_data = f_in.read()
+    cipher = AESGCMCipher(password, iterations_password)
 
-        decrypt_iterations = 0
-        if decrypt_iter_entry.get().strip() == "":
-            decrypt_iterations = 100000
-        else:
-            try:
-                decrypt_iterations = int(decrypt_iter_entry.get())
-            except ValueError:
-                messagebox.showerror("Ошибка", "Количество итераций для расшифровки должно быть числом!")
-                return
-        
-        cipher = AESGCMCipher(password, iterations_password)
-        decrypted_data = cipher.decrypt(encrypted_data, decrypt_iterations)
-
-        with open(save_path, 'wb') as f_out:
-            f_out.write(decrypted_data)
+    def job(progress):
+        # Расшифрованные данные попадают в save_path только после проверки тега
+        with open(file_path, 'rb') as f_in:
+            return replace_when_done(
+                save_path, lambda f_out: cipher.decrypt_stream(f_in, f_out, decrypt_iterations, progress)
+            )
 
+    def done(used_iterations):
         messagebox.showinfo("Успех", "Файл успешно расшифрован!")
-    except Exception as e:
-        messagebox.showerror("Ошибка", f"Не удалось расшифровать файл: {e}")
+
+    run_in_background("Расшифрование файла", job, done)
 
 
 def copy_result():
@@ -372,4 +446,24 @@ encrypt_file_button.pack(side=tk.LEFT, padx=5)
 decrypt_file_button = tk.Button(file_button_frame, text="Расшифровать файл", command=decrypt_file)
 decrypt_file_button.pack(side=tk.LEFT, padx=5)
 
+# === Блок выполнения операции ===
+progress_frame = tk.LabelFrame(root, text="Выполнение", padx=10, pady=10)
+progress_frame.pack(pady=10, padx=10, fill="x", expand=True)
+
+progress_bar = ttk.Progressbar(progress_frame, mode='determinate')
+progress_bar.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+
+status_label = tk.Label(progress_frame, text="Готово", width=30, anchor="w")
+status_label.pack(side=tk.LEFT, padx=5)
+
+cancel_button = tk.Button(progress_frame, text="Отмена", command=cancel_operation, state=tk.DISABLED)
+cancel_button.pack(side=tk.RIGHT, padx=5)
+
+status_title = ""
+# Кнопки, которые блокируются на время фоновой операции
+action_buttons = [
+    encrypt_text_button, decrypt_text_button, clear_button,
+    encrypt_file_button, decrypt_file_button,
+]
+
 root.mainloop()
\ No newline at end of file
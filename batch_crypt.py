@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+Пакетное шифрование, расшифровка и проверка файлов (например, архивов бота *.zip.enc)
+без GUI. Файлы обрабатываются параллельно в нескольких процессах, ключ выводится
+один раз на каждую уникальную пару (соль, итерации).
+
+Примеры:
+    python batch_crypt.py verify backups/
+    python batch_crypt.py decrypt "backups/*.zip.enc" -o restored/ --summary report.json
+    python batch_crypt.py encrypt data/ -o encrypted/ -j 4
+
+Пароли берутся из ENCRYPTION_PASSWORD / ITERATIONS_PASSWORD (в том числе из .env),
+иначе запрашиваются в терминале.
+"""
+import argparse
+import getpass
+import glob
+import json
+import os
+import sys
+import time
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import crypto_backends
+from cipher_logic import (
+    AESGCMCipher, SALT_SIZE, HEADER_SIZE, TAG_SIZE,
+    derive_key, encrypt_stream_with_key, decrypt_stream_with_key,
+)
+
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    load_dotenv = None
+
+ENCRYPTED_SUFFIX = ".enc"
+
+# ================== Задачи для процессов-исполнителей ==================
+
+class _NullSink:
+    """Приёмник расшифрованных данных для verify: ничего не пишет на диск."""
+
+    def write(self, data):
+        return len(data)
+
+
+def derive_key_task(password: str, salt: bytes, iterations: int) -> tuple:
+    started = time.perf_counter()
+    key = derive_key(password.encode('utf-8'), salt, iterations)
+    return key, time.perf_counter() - started
+
+
+def encrypt_file_task(key: bytes, salt: bytes, source: str, output: str) -> dict:
+    started = time.perf_counter()
+    temp_path = output + ".part"
+    try:
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        with open(source, 'rb') as f_in, open(temp_path, 'wb') as f_out:
+            encrypt_stream_with_key(key, salt, f_in, f_out)
+        os.replace(temp_path, output)
+        return _result("ok", os.path.getsize(source), started)
+    except OSError as e:
+        return _result("error", 0, started, str(e))
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def decrypt_file_task(key: bytes, source: str, output: str) -> dict:
+    """output=None - только проверка тега (verify), без записи на диск."""
+    started = time.perf_counter()
+    temp_path = output + ".part" if output else None
+    try:
+        size = os.path.getsize(source)
+        if temp_path:
+            os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        with open(source, 'rb') as f_in, (open(temp_path, 'wb') if temp_path else nullcontext(_NullSink())) as f_out:
+            decrypt_stream_with_key(key, f_in, f_out)
+        if temp_path:
+            os.replace(temp_path, output)
+        return _result("ok", size, started)
+    except ValueError as e:
+        # Неверный тег: неверный ключ (итерации) или повреждённые данные
+        return _result("auth_failed", 0, started, str(e))
+    except OSError as e:
+        return _result("error", 0, started, str(e))
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _result(status: str, size: int, started: float, error: str = "") -> dict:
+    return {'status': status, 'bytes': size, 'seconds': time.perf_counter() - started, 'error': error}
+
+# ================== Сбор файлов ==================
+
+def collect_files(patterns: list, operation: str) -> list:
+    """
+    Разворачивает пути, glob-шаблоны и папки в список (путь, относительное имя).
+    В папках для decrypt/verify берутся только файлы *.enc.
+    """
+    files = []
+    seen = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True) or [pattern]
+        for match in sorted(matches):
+            if os.path.isdir(match):
+                for dirpath, _, filenames in os.walk(match):
+                    for filename in sorted(filenames):
+                        if operation != "encrypt" and not filename.endswith(ENCRYPTED_SUFFIX):
+                            continue
+                        path = os.path.join(dirpath, filename)
+                        if path not in seen:
+                            seen.add(path)
+                            files.append((path, os.path.relpath(path, match)))
+            elif match not in seen:
+                seen.add(match)
+                files.append((match, os.path.basename(match)))
+    return files
+
+
+def output_path(out_dir: str, relative: str, operation: str) -> str:
+    if operation == "encrypt":
+        return os.path.join(out_dir, relative + ENCRYPTED_SUFFIX)
+    if relative.endswith(ENCRYPTED_SUFFIX):
+        relative = relative[:-len(ENCRYPTED_SUFFIX)]
+    return os.path.join(out_dir, relative)
+
+# ================== Планировщик ==================
+
+def run_batch(operation: str, files: list, out_dir: str, cipher: AESGCMCipher,
+              preferred_iterations, jobs: int) -> dict:
+    started = time.perf_counter()
+    password = cipher.password.decode('utf-8')
+    results = {}
+    keys = {}          # (salt, iterations) -> key
+    derivations = {}   # future -> (salt, iterations)
+    file_tasks = {}    # future -> (path, salt, iterations)
+    waiting = {}       # (salt, iterations) -> [path, ...] ждут вывода ключа
+    kdf_seconds = 0.0
+
+    outputs = {}
+    targets = set()
+    for path, relative in files:
+        target = output_path(out_dir, relative, operation) if operation != "verify" else None
+        if target and target in targets:
+            results[path] = _result("error", 0, time.perf_counter(), f"Дублируется выходной файл {target}")
+            continue
+        targets.add(target)
+        outputs[path] = target
+
+    # Дочерние процессы используют те же реализации, что выбрал родительский
+    backends = crypto_backends.active_backends()
+    with ProcessPoolExecutor(max_workers=jobs, initializer=crypto_backends.use,
+                             initargs=(backends['kdf'], backends['aead'])) as pool:
+        def submit_file(path, salt, iterations):
+            key = keys[(salt, iterations)]
+            if operation == "encrypt":
+                future = pool.submit(encrypt_file_task, key, salt, path, outputs[path])
+            else:
+                future = pool.submit(decrypt_file_task, key, path, outputs[path])
+            file_tasks[future] = (path, salt, iterations)
+
+        def request(path, salt, iterations):
+            pair = (salt, iterations)
+            if pair in keys:
+                submit_file(path, salt, iterations)
+            elif pair in waiting:
+                waiting[pair].append(path)
+            else:
+                waiting[pair] = [path]
+                derivations[pool.submit(derive_key_task, password, salt, iterations)] = pair
+
+        candidates = {}
+        if operation == "encrypt":
+            # Одна соль и один вывод ключа на весь пакет; nonce у каждого файла свой
+            salt = os.urandom(SALT_SIZE)
+            iterations = cipher.resolve_iterations(preferred_iterations)
+            for path in outputs:
+                candidates[path] = []
+                request(path, salt, iterations)
+        else:
+            default = cipher.candidate_iterations(preferred_iterations)
+            for path in outputs:
+                try:
+                    with open(path, 'rb') as f:
+                        salt = f.read(SALT_SIZE)
+                    if os.path.getsize(path) < HEADER_SIZE + TAG_SIZE:
+                        raise ValueError("Слишком короткий файл")
+                except (OSError, ValueError) as e:
+                    results[path] = _result("error", 0, time.perf_counter(), str(e))
+                    continue
+                candidates[path] = list(default)
+                request(path, salt, candidates[path].pop(0))
+
+        pending = set(derivations) | set(file_tasks)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in derivations:
+                    pair = derivations.pop(future)
+                    keys[pair], seconds = future.result()
+                    kdf_seconds += seconds
+                    for path in waiting.pop(pair):
+                        submit_file(path, *pair)
+                else:
+                    path, salt, iterations = file_tasks.pop(future)
+                    result = future.result()
+                    result['iterations'] = iterations
+                    if result['status'] == "auth_failed" and candidates[path]:
+                        request(path, salt, candidates[path].pop(0))
+                    else:
+                        results[path] = result
+            pending = set(derivations) | set(file_tasks)
+
+    elapsed = time.perf_counter() - started
+    entries = []
+    for path, _ in files:
+        result = results[path]
+        seconds = result['seconds']
+        entries.append({
+            'source': path,
+            'output': outputs.get(path),
+            'status': result['status'],
+            'bytes': result['bytes'],
+            'seconds': round(seconds, 3),
+            'mb_per_s': round(result['bytes'] / seconds / 1e6, 2) if seconds and result['bytes'] else 0,
+            'iterations': result.get('iterations'),
+            'error': result['error'],
+        })
+    total_bytes = sum(e['bytes'] for e in entries)
+    ok = sum(1 for e in entries if e['status'] == "ok")
+    return {
+        'operation': operation,
+        'files': entries,
+        'ok': ok,
+        'failed': len(entries) - ok,
+        'bytes': total_bytes,
+        'seconds': round(elapsed, 3),
+        'throughput_mb_s': round(total_bytes / elapsed / 1e6, 2) if elapsed else 0,
+        'key_derivations': len(keys),
+        'kdf_seconds': round(kdf_seconds, 3),
+        'backends': backends,
+        'jobs': jobs,
+    }
+
+# ================== CLI ==================
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Пакетная обработка зашифрованных архивов (AES-GCM)")
+    parser.add_argument("operation", choices=["encrypt", "decrypt", "verify"])
+    parser.add_argument("paths", nargs="+", help="файлы, папки или glob-шаблоны")
+    parser.add_argument("-o", "--output", default=".", help="папка для результатов (encrypt/decrypt)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="число процессов")
+    parser.add_argument("--iterations", type=int, default=None,
+                        help="итерации (для расшифровки пробуются первыми, затем вычисленные из паролей)")
+    parser.add_argument("--summary", default="-", help="куда записать JSON-отчёт ('-' - stdout)")
+    args = parser.parse_args(argv)
+
+    if load_dotenv:
+        load_dotenv()
+    password = os.getenv("ENCRYPTION_PASSWORD") or getpass.getpass("Пароль шифрования: ")
+    iterations_password = os.getenv("ITERATIONS_PASSWORD")
+    if iterations_password is None:
+        iterations_password = getpass.getpass("Пароль для итераций (Enter - пусто): ")
+    cipher = AESGCMCipher(password, iterations_password)
+
+    backend_report = crypto_backends.select_fastest(
+        os.getenv("CRYPTO_KDF_BACKEND") or None, os.getenv("CRYPTO_AEAD_BACKEND") or None
+    )
+    print(f"Криптография: {crypto_backends.format_report(backend_report)}", file=sys.stderr)
+
+    files = collect_files(args.paths, args.operation)
+    missing = [path for path, _ in files if not os.path.isfile(path)]
+    if missing:
+        print(f"❌ Файлы не найдены: {', '.join(missing)}", file=sys.stderr)
+        return 2
+    if not files:
+        print("❌ Нет файлов для обработки", file=sys.stderr)
+        return 2
+
+    try:
+        summary = run_batch(args.operation, files, args.output, cipher, args.iterations, max(1, args.jobs))
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+
+    report = json.dumps(summary, ensure_ascii=False, indent=2)
+    if args.summary == "-":
+        print(report)
+    else:
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            f.write(report)
+    print(f"Готово: {summary['ok']} успешно, {summary['failed']} с ошибками, "
+          f"{summary['throughput_mb_s']} МБ/с", file=sys.stderr)
+    return 0 if not summary['failed'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,18 +2,40 @@
 import os
 import asyncio
 import docker
+import gzip
+import hashlib
 import html
-import shutil 
+import re
+import secrets
+import shlex
+import signal
+import tempfile
+import threading
+import time
+import zipfile
+from urllib.parse import urlparse
 from datetime import datetime, timezone 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
+from telegram.error import TelegramError
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, TypeHandler, MessageHandler, filters
 from dotenv import load_dotenv
 from typing import Optional # Добавлен для Optional
 
+from concurrency import KeyedLocks, OrderedUpdateProcessor
+from docker_exec import EXEC_NAME_MAX_LENGTH, ExecOutput, parse_exec_commands, run_exec, with_kill_timeout
+from docker_hosts import DEFAULT_HOSTS, DockerHosts
+from docker_sources import DEFAULT_HELPER_IMAGE, parse_source, stream_source
+from metrics import LatencyTracker, TimestampedUpdateQueue
+from webhook_server import WebhookServer
+
 # ИМПОРТИРУЙТЕ ВАШУ ЛОГИКУ ШИФРОВАНИЯ
 # Убедитесь, что файл cipher_logic.py находится в той же папке
 try:
-    from cipher_logic import AESGCMCipher
+    from cipher_logic import AESGCMCipher, EncryptingWriter, calculate_iterations_from_password, derive_key
+    from key_pool import KeyPool
+    from restore import iter_sources, verify_or_restore
+    from indexed_archive import ARCHIVE_SUFFIX, verify_or_restore_archive, write_archive
+    import crypto_backends
 except ImportError:
     print("❌ Ошибка: Не найден модуль cipher_logic.py. Функции шифрования не будут работать.")
     AESGCMCipher = None
@@ -21,6 +43,23 @@ except ImportError:
 
 load_dotenv()
 
+# Кнопки, которые только показывают данные и не должны ждать долгих действий
+READ_ONLY_CALLBACKS = ("list", "back")
+READ_ONLY_CALLBACK_PREFIXES = ("container_", "action_logs_")
+
+# Зашифрованный архив или его часть: name.zip.enc, name.tar.enc, name.dtga, name.zip.enc.001, ...
+BACKUP_PART_RE = re.compile(r'^(?P<base>.+\.(?:enc|dtga))(?:\.(?P<part>\d{1,4}))?$')
+# Сколько записей архива показывать в отчёте прямо в сообщении
+RESTORE_REPORT_LINES = 20
+# Сколько последних символов вывода exec показывать в сообщении (полный вывод - файлом)
+EXEC_PREVIEW_CHARS = 3000
+# Сколько ждать завершения команды после EXEC_TIMEOUT, чтобы получить код выхода от timeout -s KILL
+EXEC_KILL_GRACE = 2
+# Telegram принимает callback_data не длиннее 64 байт
+CALLBACK_DATA_LIMIT = 64
+# Место для ссылки на контейнер после самого длинного префикса (exec_<команда>:)
+CONTAINER_REF_LIMIT = CALLBACK_DATA_LIMIT - len("exec_:") - EXEC_NAME_MAX_LENGTH
+
 class DockerBot:
     def __init__(self):
         self.bot_token = os.getenv('BOT_TOKEN')
@@ -31,36 +70,163 @@ class DockerBot:
         self.iter_password = os.getenv("ITERATIONS_PASSWORD", "")
         # Используем путь внутри контейнера, указанный в .env
         self.folder_to_archive = os.getenv("FOLDER_TO_ARCHIVE") or "/app/data_to_archive"
+        # Куда распаковываются архивы при восстановлении
+        self.restore_folder = os.getenv("RESTORE_FOLDER") or "/app/restore"
+        # Источники бэкапа: имя=путь через запятую. Имя - префикс файла архива (как server_names_env)
+        self.backup_sources = self._parse_backup_sources(os.getenv("BACKUP_SOURCES", ""))
+        # Общий бюджет на все источники: сколько архивируются/шифруются одновременно (CPU и диск)
+        # и сколько архивов одновременно отправляются в Telegram (сеть)
+        self.backup_slots = asyncio.Semaphore(int(os.getenv("BACKUP_CONCURRENCY", "2")))
+        self.upload_slots = asyncio.Semaphore(int(os.getenv("BACKUP_UPLOAD_CONCURRENCY", "2")))
+        # Образ вспомогательного контейнера для чтения томов (volume:...)
+        self.backup_helper_image = os.getenv("BACKUP_HELPER_IMAGE") or DEFAULT_HELPER_IMAGE
+        # zip (.zip.enc, один тег на архив) или indexed (.dtga, восстановление отдельных файлов)
+        self.archive_format = os.getenv("ARCHIVE_FORMAT", "zip").strip().lower()
         
         # ------------------------------------
 
+        # --- Параллельная обработка обновлений ---
+        self.max_concurrent_updates = int(os.getenv("MAX_CONCURRENT_UPDATES", "16"))
+        # Не даём одновременно запускать/останавливать один и тот же контейнер
+        self.container_locks = KeyedLocks()
+        self.backup_locks = KeyedLocks()
+
+        # --- Команды в контейнерах: только из списка EXEC_COMMANDS ---
+        self.exec_commands = parse_exec_commands(os.getenv("EXEC_COMMANDS", ""))
+        self.exec_timeout = float(os.getenv("EXEC_TIMEOUT", "30"))
+        # timeout - команда запускается через timeout -s KILL и завершается в контейнере;
+        # none - для образов без утилиты timeout (по EXEC_TIMEOUT прерывается только чтение)
+        self.exec_kill = os.getenv("EXEC_KILL", "timeout").strip().lower()
+        self.exec_max_output = int(os.getenv("EXEC_MAX_OUTPUT", str(1024 * 1024)))
+        # Не чаще одного редактирования сообщения с выводом за столько секунд (лимиты Telegram)
+        self.exec_edit_interval = float(os.getenv("EXEC_EDIT_INTERVAL", "2"))
+        self.exec_slots = asyncio.Semaphore(int(os.getenv("EXEC_CONCURRENCY", "4")))
+
+        # --- Режим получения обновлений: polling (по умолчанию) или webhook ---
+        self.update_mode = os.getenv("UPDATE_MODE", "polling").strip().lower()
+        self.webhook_url = os.getenv("WEBHOOK_URL", "")
+        self.webhook_listen = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+        self.webhook_port = int(os.getenv("WEBHOOK_PORT", "8443"))
+        # Локальный путь; по умолчанию совпадает с путём из WEBHOOK_URL
+        self.webhook_path = os.getenv("WEBHOOK_PATH") or urlparse(self.webhook_url).path or "/"
+        # Telegram присылает его в заголовке X-Telegram-Bot-Api-Secret-Token
+        self.webhook_secret = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+        # По умолчанию Telegram держит не больше соединений, чем бот обрабатывает параллельно;
+        # setWebhook принимает только 1-100
+        max_connections = int(os.getenv("WEBHOOK_MAX_CONNECTIONS") or self.max_concurrent_updates)
+        self.webhook_max_connections = max(1, min(100, max_connections))
+        if self.webhook_max_connections != max_connections and self.update_mode == "webhook":
+            print(f"⚠️ WEBHOOK_MAX_CONNECTIONS={max_connections} вне диапазона 1-100 Telegram, "
+                  f"используется {self.webhook_max_connections}")
+        self.webhook_drain_timeout = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "10"))
+        # Альтернативный Bot API (локальный telegram-bot-api или заглушка для замеров)
+        self.bot_api_url = os.getenv("BOT_API_URL", "").rstrip('/')
+
+        self.latency = LatencyTracker()
+
+        # --- Выбор реализации PBKDF2/AES-GCM: самопроверка и замер при запуске ---
+        self.crypto_summary = "недоступно"
+        if AESGCMCipher:
+            try:
+                report = crypto_backends.select_fastest(
+                    os.getenv("CRYPTO_KDF_BACKEND") or None, os.getenv("CRYPTO_AEAD_BACKEND") or None
+                )
+                self.crypto_summary = crypto_backends.format_report(report)
+                print(f"Криптография: {self.crypto_summary}")
+            except (ValueError, RuntimeError) as e:
+                print(f"⚠️ Выбор реализации шифрования: {e}. Используется {crypto_backends.active_backends()}")
+
         if not self.enc_password:
              print("⚠️ ВНИМАНИЕ: Пароль шифрования (ENCRYPTION_PASSWORD) не установлен в .env.")
+
+        # --- Ключи для бэкапов выводятся заранее, в фоне (KEY_POOL_SIZE=0 - при каждом бэкапе) ---
+        self.key_pool = None
+        if AESGCMCipher and self.enc_password:
+            self.key_pool = KeyPool(
+                AESGCMCipher(self.enc_password, self.iter_password), int(os.getenv("KEY_POOL_SIZE", "2"))
+            )
         
         # Проверка и создание папки
         if not os.path.isdir(self.folder_to_archive):
             os.makedirs(self.folder_to_archive, exist_ok=True)
             print(f"Папка {self.folder_to_archive} не найдена. Создана пустая папка.")
 
-        try:
-            # Проверка, что Docker Socket смонтирован
-            if not os.path.exists('/var/run/docker.sock'):
-                raise Exception("Docker socket не найден: /var/run/docker.sock")
-
-            self.docker_client = docker.DockerClient(base_url='unix:///var/run/docker.sock')
-            self.docker_client.ping()
-            print("Docker подключение успешно установлено")
-        except Exception as e:
-            print(f"Ошибка подключения к Docker: {e}")
-            print("Убедитесь, что Docker socket смонтирован в контейнер")
-            self.docker_client = None 
+        # --- Docker-хосты: локальный сокет и/или удалённые демоны (tcp://, ssh://) ---
+        self.docker_hosts = DockerHosts(
+            os.getenv("DOCKER_HOSTS") or DEFAULT_HOSTS,
+            timeout=float(os.getenv("DOCKER_TIMEOUT", "10")),
+            pool_size=int(os.getenv("DOCKER_POOL_SIZE", "4")),
+        )
+        # Короткие ссылки #<хеш> на контейнеры, чьё "хост/имя" не помещается в callback_data
+        self.container_refs = {}
+        # Недоступный при запуске хост не отключается: к нему снова обратятся при следующем запросе
+        for name, error in self.docker_hosts.ping_all().items():
+            if error:
+                print(f"Ошибка подключения к Docker ({name}): {error}")
+                print("Убедитесь, что Docker socket смонтирован в контейнер или демон доступен по сети")
+            else:
+                print(f"Docker подключение успешно установлено ({name})")
 
     # --- Вспомогательные функции ---
 
+    def _is_allowed(self, user_id) -> bool:
+        """Проверяет, есть ли у пользователя доступ к боту"""
+        return not self.allowed_users or user_id in self.allowed_users
+
     def _escape_html(self, text):
         """Экранирует специальные символы HTML для безопасного отображения"""
         return html.escape(str(text))
 
+    def _parse_backup_sources(self, spec: str) -> dict:
+        """
+        BACKUP_SOURCES="app=/app/data/app,db=volume:pgdata!stop,www=container:prod/web:/var/www";
+        без него - FOLDER_TO_ARCHIVE под именем server_names_env
+        """
+        sources = {}
+        for item in spec.split(','):
+            item = item.strip()
+            if not item:
+                continue
+            name, sep, path = item.partition('=')
+            name, path = name.strip(), path.strip()
+            if not sep or not name or not path or '/' in name or '\\' in name:
+                raise ValueError(f"Неверный элемент BACKUP_SOURCES: {item!r} (ожидается имя=путь)")
+            if name in sources:
+                raise ValueError(f"Источник {name} указан в BACKUP_SOURCES дважды")
+            parse_source(path)  # Ошибка в volume:/container: - сразу при запуске
+            sources[name] = path
+        if not sources:
+            sources[str(os.getenv("server_names_env"))] = self.folder_to_archive
+        return sources
+
+    def _container_ref(self, host_name: str, container_name: str) -> str:
+        """
+        Ссылка на контейнер в callback_data: хост/имя, а если она длиннее CONTAINER_REF_LIMIT
+        байт - #<хеш>, который запоминается в container_refs.
+        """
+        ref = f"{host_name}/{container_name}"
+        if len(ref.encode('utf-8')) <= CONTAINER_REF_LIMIT:
+            return ref
+        short_ref = "#" + hashlib.sha1(ref.encode('utf-8')).hexdigest()[:16]
+        self.container_refs[short_ref] = (host_name, container_name)
+        return short_ref
+
+    async def _resolve_container_ref(self, ref: str):
+        """
+        (хост, имя); в кнопках, созданных до появления нескольких хостов, хоста нет.
+        Неизвестный #<хеш> (например, после перезапуска бота) ищется среди контейнеров всех хостов.
+        """
+        if not ref.startswith("#"):
+            host_name, sep, container_name = ref.partition("/")
+            return (host_name, container_name) if sep else (None, ref)
+        if ref not in self.container_refs:
+            containers, _ = await self.get_containers()
+            for container in containers:
+                self._container_ref(container['host'], container['name'])
+        if ref not in self.container_refs:
+            raise KeyError("Контейнер не найден, откройте список контейнеров заново")
+        return self.container_refs[ref]
+
     def _format_uptime(self, started_at_str):
         if not started_at_str: return "N/A"
         import datetime
@@ -91,92 +257,134 @@ class DockerBot:
         if not self.enc_password:
              raise Exception("Пароль шифрования (ENCRYPTION_PASSWORD) не установлен.")
 
-        current_dir = os.getcwd() 
-        temp_zip_path_base = os.path.join(current_dir, os.path.basename(folder_path))
-        
-        try:
-            shutil.make_archive(
-                base_name=temp_zip_path_base,
-                format='zip', 
-                root_dir=os.path.dirname(folder_path), 
-                base_dir=os.path.basename(folder_path)
-            )
-            temp_zip_path = temp_zip_path_base + ".zip"
-        except Exception as e:
-            print(f"Ошибка архивирования: {e}")
-            raise
+        # Архивация и PBKDF2 блокируют, поэтому выполняются в отдельном потоке.
+        # Блокировка по папке: одна и та же папка не архивируется дважды одновременно
+        async with self.backup_locks.hold(folder_path):
+            return await asyncio.to_thread(self._archive_and_encrypt_sync, folder_path, output_file)
 
-        try:
-            with open(temp_zip_path, 'rb') as f:
-                archive_data = f.read()
-        finally:
-            if os.path.exists(temp_zip_path):
-                os.remove(temp_zip_path)
+    def _archive_and_encrypt_sync(self, folder_path: str, output_file: str) -> tuple[str, int]:
+        # Готовый ключ из пула: шифрование начинается сразу, без PBKDF2
+        with self.key_pool.acquire() as prepared:
+            if self.archive_format == "indexed":
+                write_archive(folder_path, output_file, self.enc_password.encode('utf-8'), prepared.iterations,
+                              salt=prepared.salt, key=prepared.key)
+                return output_file, prepared.iterations
 
-        cipher = AESGCMCipher(self.enc_password, self.iter_password)
-        encrypted_data, iterations = cipher.encrypt(archive_data, iterations=None) 
+            # zip пишется сразу в шифрующий поток: без временного zip и без чтения архива в память
+            with open(output_file, 'wb') as f:
+                writer = EncryptingWriter(prepared.key, prepared.salt, f)
+                try:
+                    self._write_zip(folder_path, writer)
+                except Exception as e:
+                    print(f"Ошибка архивирования: {e}")
+                    raise
+                writer.close()
 
-        with open(output_file, 'wb') as f:
-            f.write(encrypted_data)
+            return output_file, prepared.iterations
 
-        return output_file, iterations
+    async def stream_docker_source(self, source: dict, output_file: str) -> dict:
+        """Tar-поток тома или пути контейнера из Engine API сразу в зашифрованный файл."""
+        if not AESGCMCipher:
+            raise Exception("Модуль шифрования (cipher_logic.py) не загружен.")
+        host = self.docker_hosts.get(source['host'])
+
+        def run(client):
+            # Ключ берётся (или выводится) до паузы/остановки, чтобы простой длился только чтение потока
+            with self.key_pool.acquire() as prepared, open(output_file, 'wb') as f:
+                writer = EncryptingWriter(prepared.key, prepared.salt, f)
+                stats = stream_source(client, source, writer, self.backup_helper_image)
+                writer.close()
+            return stats
+
+        if source['kind'] == "container" and source['mode']:
+            # Пока контейнер приостановлен, кнопки запуска/остановки ждут
+            async with self.container_locks.hold((host.name, source['target'])):
+                return await host.call(run, timeout=None)
+        return await host.call(run, timeout=None)
+
+    def _write_zip(self, folder_path: str, dst):
+        """Zip папки с тем же содержимым, что и shutil.make_archive (пути начинаются с имени папки)"""
+        root_dir = os.path.dirname(os.path.abspath(folder_path))
+        with zipfile.ZipFile(dst, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for dirpath, dirnames, filenames in os.walk(os.path.abspath(folder_path)):
+                dirnames.sort()
+                archive.write(dirpath, os.path.relpath(dirpath, root_dir))
+                for filename in sorted(filenames):
+                    path = os.path.join(dirpath, filename)
+                    if os.path.isfile(path):
+                        archive.write(path, os.path.relpath(path, root_dir))
 
     # --- Docker-функции (не изменены) ---
 
     async def get_containers(self):
-        if not self.docker_client: return []
-        # ... (код get_containers)
-        try:
-            containers = self.docker_client.containers.list(all=True)
-            result = []
-            for container in containers:
-                if container.image.tags: image_tag = container.image.tags[0]
-                else: image_tag = container.image.short_id
-                started_at = None
-                try: started_at = container.attrs['State'].get('StartedAt')
-                except (KeyError, AttributeError): started_at = None
-                result.append({'name': container.name, 'status': container.status, 'image': image_tag, 'started_at': started_at})
-            return result
-        except Exception as e:
-            print(f"Ошибка при получении контейнеров: {e}")
-            return []
+        """
+        Контейнеры всех хостов. Хосты опрашиваются параллельно, каждый в своих потоках
+        и со своим таймаутом. Возвращает (контейнеры, {хост: ошибка}).
+        """
+        results, errors = await self.docker_hosts.gather(self._list_containers_sync)
+        containers = [
+            dict(container, host=host_name)
+            for host_name, host_containers in results.items() for container in host_containers
+        ]
+        for host_name, error in errors.items():
+            print(f"Ошибка при получении контейнеров ({host_name}): {error}")
+        return containers, errors
+
+    def _list_containers_sync(self, client):
+        # Docker SDK синхронный (и обращается к API за каждым образом) — выполняется в потоках хоста
+        result = []
+        for container in client.containers.list(all=True):
+            if container.image.tags: image_tag = container.image.tags[0]
+            else: image_tag = container.image.short_id
+            started_at = None
+            try: started_at = container.attrs['State'].get('StartedAt')
+            except (KeyError, AttributeError): started_at = None
+            result.append({'name': container.name, 'status': container.status, 'image': image_tag, 'started_at': started_at})
+        return result
 
-    async def start_container(self, container_name):
-        if not self.docker_client: return False
+    async def _run_container_action(self, host_name, container_name, action):
+        """Выполняет действие над контейнером в потоке хоста под блокировкой этого контейнера"""
+        host = self.docker_hosts.get(host_name)
+
+        def call(client):
+            container = client.containers.get(container_name)
+            getattr(container, action)()
+
+        async with self.container_locks.hold((host.name, container_name)):
+            # stop/restart ждут остановки контейнера; таймаут сокета Docker SDK учитывает это сам
+            await host.call(call, timeout=None)
+
+    async def start_container(self, host_name, container_name):
         try:
-            container = self.docker_client.containers.get(container_name)
-            container.start()
+            await self._run_container_action(host_name, container_name, "start")
             return True
         except Exception as e:
             print(f"Ошибка при запуске контейнера: {e}")
             return False
 
-    async def stop_container(self, container_name):
-        if not self.docker_client: return False
+    async def stop_container(self, host_name, container_name):
         try:
-            container = self.docker_client.containers.get(container_name)
-            container.stop()
+            await self._run_container_action(host_name, container_name, "stop")
             return True
         except Exception as e:
             print(f"Ошибка при остановке контейнера: {e}")
             return False
 
-    async def restart_container(self, container_name):
-        if not self.docker_client: return False
+    async def restart_container(self, host_name, container_name):
         try:
-            container = self.docker_client.containers.get(container_name)
-            container.restart()
+            await self._run_container_action(host_name, container_name, "restart")
             return True
         except Exception as e:
             print(f"Ошибка при перезапуске контейнера: {e}")
             return False
 
-    async def get_container_logs(self, container_name, lines=20):
-        if not self.docker_client: return "Docker клиент недоступен."
+    async def get_container_logs(self, host_name, container_name, lines=20):
+        def fetch(client):
+            container = client.containers.get(container_name)
+            return container.logs(tail=lines).decode('utf-8')
+
         try:
-            container = self.docker_client.containers.get(container_name)
-            logs = container.logs(tail=lines).decode('utf-8')
-            return logs
+            return await self.docker_hosts.get(host_name).call(fetch)
         except Exception as e:
             print(f"Ошибка при получении логов: {e}")
             return f"Ошибка при получении логов: {self._escape_html(e)}"
@@ -186,7 +394,7 @@ class DockerBot:
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /start"""
         user_id = update.effective_user.id
-        if hasattr(self, 'allowed_users') and self.allowed_users and user_id not in self.allowed_users:
+        if not self._is_allowed(user_id):
             await update.message.reply_text("❌ У вас нет доступа к этому боту.")
             return
 
@@ -201,6 +409,45 @@ class DockerBot:
             reply_markup=reply_markup, parse_mode='HTML'
         )
 
+    async def stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /stats — задержка до старта обработки: от очереди приложения и от источника"""
+        if not self._is_allowed(update.effective_user.id):
+            await update.message.reply_text("❌ У вас нет доступа к этому боту.")
+            return
+
+        await update.message.reply_text(
+            f"📊 <b>Статистика</b>\n\n"
+            f"Режим: <code>{self._escape_html(self.update_mode)}</code>\n"
+            f"Очередь → обработчик: {self._escape_html(self.latency.queue.format_summary())}\n"
+            f"Источник → обработчик: {self._escape_html(self.latency.source.format_summary())}\n"
+            f"Криптография: {self._escape_html(self.crypto_summary)}\n"
+            f"Ключи бэкапов: {self._escape_html(self.key_pool.format_summary() if self.key_pool else 'нет пароля')}",
+            parse_mode='HTML'
+        )
+
+    def update_order_key(self, update):
+        """
+        Ключ порядка обработки для OrderedUpdateProcessor. Нажатия на одном сообщении
+        и команды в одном чате выполняются по очереди; кнопки просмотра — без очереди.
+        """
+        if not isinstance(update, Update):
+            return None
+        query = update.callback_query
+        if query:
+            data = query.data or ""
+            if data in READ_ONLY_CALLBACKS or data.startswith(READ_ONLY_CALLBACK_PREFIXES):
+                return None
+            if query.message:
+                return ("message", query.message.chat.id, query.message.message_id)
+            return ("inline", query.inline_message_id)
+        if update.effective_chat:
+            return ("chat", update.effective_chat.id)
+        return None
+
+    async def track_latency(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Выполняется первым для каждого обновления (группа -1) и фиксирует задержку"""
+        self.latency.mark_start(update)
+
     async def button_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка нажатий на кнопки"""
         query = update.callback_query
@@ -216,6 +463,10 @@ class DockerBot:
             await self.show_container_info(query)
         elif query.data.startswith("action_"):
             await self.handle_action(query)
+        elif query.data.startswith("restore_"):
+            await self.handle_restore_button(query, context)
+        elif query.data.startswith("exec_"):
+            await self.handle_exec_button(query, context)
 
     async def start_menu(self, query):
         """Показать главное меню"""
@@ -231,77 +482,298 @@ class DockerBot:
         )
     
     async def handle_encrypt_archive(self, query, context: ContextTypes.DEFAULT_TYPE):
-        """Архивирует заданную папку, шифрует ее и отправляет в чат."""
+        """Архивирует все источники параллельно, шифрует и отправляет каждый архив, как только он готов."""
         
         if not self.enc_password:
             await query.edit_message_text("❌ Ошибка: Пароль шифрования (ENCRYPTION_PASSWORD) не задан в .env.", parse_mode='HTML')
             return
         
-        folder_display_name = self._escape_html(os.path.basename(self.folder_to_archive))
-        
-        message = await query.edit_message_text(
-            f"⏳ Начинаю архивацию и шифрование папки <code>{folder_display_name}</code>...", 
-            parse_mode='HTML'
-        )
+        chat_id = query.message.chat_id
+        names = list(self.backup_sources)
+        message = await query.edit_message_text(self._format_backup_summary({}, names), parse_mode='HTML')
 
-        output_filename = ""
-        encrypted_filepath = ""
-        try:
-            server_names_env = os.getenv("server_names_env")
-            timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
-            output_filename = f"{server_names_env}-{timestamp}.zip.enc"
-            
-            encrypted_filepath, iterations = await self.create_archive_and_encrypt(
-                self.folder_to_archive, 
-                os.path.join(os.getcwd(), output_filename)
-            )
+        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        tasks = [
+            asyncio.create_task(self.backup_source(context, chat_id, name, path, timestamp))
+            for name, path in self.backup_sources.items()
+        ]
+        # Медленный или упавший источник не задерживает отправку остальных
+        results = {}
+        for finished in asyncio.as_completed(tasks):
+            result = await finished
+            results[result['name']] = result
+            try:
+                await context.bot.edit_message_text(
+                    chat_id=chat_id,
+                    message_id=message.message_id,
+                    text=self._format_backup_summary(results, names),
+                    parse_mode='HTML'
+                )
+            except TelegramError as e:
+                print(f"Не удалось обновить статус бэкапа: {e}")
 
-            await context.bot.send_document(
-                chat_id=query.message.chat_id,
-                document=encrypted_filepath,
-                caption=(
-                    f"✅ <b>Архив зашифрован!</b>\n\n"
-                ),
-                parse_mode='HTML'
-            )
-            
-            await context.bot.edit_message_text(
-                chat_id=query.message.chat_id,
-                message_id=message.message_id,
-                text=f"✅ Архив успешно зашифрован и отправлен.",
-                parse_mode='HTML'
-            )
+        await self.start_menu(query)
 
+    async def backup_source(self, context: ContextTypes.DEFAULT_TYPE, chat_id: int, name: str,
+                            folder_path: str, timestamp: str) -> dict:
+        """Один источник бэкапа: архивация и шифрование, затем отправка. Ошибки не выходят за пределы источника."""
+        started = time.perf_counter()
+        result = {'name': name, 'ok': False, 'error': '', 'bytes': 0, 'seconds': 0.0}
+        docker_source = parse_source(folder_path)
+        if docker_source:
+            suffix = ".tar.enc"
+        else:
+            suffix = ARCHIVE_SUFFIX if self.archive_format == "indexed" else ".zip.enc"
+        encrypted_filepath = os.path.join(os.getcwd(), f"{name}-{timestamp}{suffix}")
+        try:
+            if docker_source:
+                async with self.backup_slots:
+                    stats = await self.stream_docker_source(docker_source, encrypted_filepath)
+                result['downtime'] = stats['downtime']
+            else:
+                if not os.path.isdir(folder_path):
+                    raise Exception(f"Папка не найдена: {folder_path}")
+                async with self.backup_slots:
+                    await self.create_archive_and_encrypt(folder_path, encrypted_filepath)
+            result['bytes'] = os.path.getsize(encrypted_filepath)
+
+            async with self.upload_slots:
+                await context.bot.send_document(
+                    chat_id=chat_id,
+                    document=encrypted_filepath,
+                    caption=(
+                        f"✅ <b>Архив зашифрован!</b>\n\n"
+                        f"Источник: <code>{self._escape_html(name)}</code>"
+                    ),
+                    parse_mode='HTML'
+                )
+            result['ok'] = True
         except Exception as e:
-            error_message = self._escape_html(f"При архивации/шифровании: {e}")
-            await context.bot.edit_message_text(
-                chat_id=query.message.chat_id,
-                message_id=message.message_id,
-                text=f"❌ **Критическая ошибка:**\n\n<code>{error_message}</code>",
-                parse_mode='HTML'
-            )
+            print(f"Ошибка бэкапа {name}: {e}")
+            result['error'] = str(e) or type(e).__name__
         finally:
-            if encrypted_filepath and os.path.exists(encrypted_filepath):
+            if os.path.exists(encrypted_filepath):
                 os.remove(encrypted_filepath)
+            result['seconds'] = time.perf_counter() - started
+        return result
 
-        await self.start_menu(query)
+    def _format_backup_summary(self, results: dict, names: list) -> str:
+        done = sum(1 for result in results.values() if result['ok'])
+        if len(results) < len(names):
+            text = f"⏳ <b>Архивация и шифрование</b> ({len(results)}/{len(names)})\n\n"
+        elif done == len(names):
+            text = f"✅ Архивы успешно зашифрованы и отправлены ({done}/{len(names)}).\n\n"
+        else:
+            text = f"⚠️ <b>Бэкап завершён с ошибками</b>: отправлено {done} из {len(names)}.\n\n"
+
+        for name in names:
+            escaped_name = self._escape_html(name)
+            result = results.get(name)
+            if result is None:
+                text += f"⏳ <code>{escaped_name}</code>\n"
+            elif result['ok']:
+                text += (f"✅ <code>{escaped_name}</code>: {result['bytes'] / 1024 / 1024:.1f} МБ "
+                         f"за {result['seconds']:.1f} сек")
+                if result.get('downtime'):
+                    text += f", простой {result['downtime']:.1f} сек"
+                text += "\n"
+            else:
+                error_message = self._escape_html(f"При архивации/шифровании: {result['error']}")
+                text += f"❌ <code>{escaped_name}</code>: {error_message}\n"
+        return text
     
+    # --- Проверка и восстановление архивов ---
+
+    async def receive_backup_part(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Принимает присланный архив .zip.enc/.tar.enc/.dtga (или его часть .zip.enc.001 и т.д.)"""
+        if not self._is_allowed(update.effective_user.id):
+            await update.message.reply_text("❌ У вас нет доступа к этому боту.")
+            return
+
+        document = update.message.document
+        match = BACKUP_PART_RE.match(document.file_name or "")
+        if not match:
+            await update.message.reply_text("❌ Ожидается зашифрованный архив <code>.zip.enc</code>, <code>.tar.enc</code>, <code>.dtga</code> или его часть <code>.zip.enc.001</code>", parse_mode='HTML')
+            return
+
+        parts = context.user_data.setdefault('restore_parts', [])
+        if parts and parts[0]['base'] != match.group('base'):
+            # Пришёл другой архив - начинаем набор частей заново
+            parts.clear()
+        parts.append({
+            'base': match.group('base'),
+            'part': int(match.group('part') or 0),
+            'name': document.file_name,
+            'file_id': document.file_id,
+            'size': document.file_size or 0,
+        })
+
+        names = ", ".join(self._escape_html(part['name']) for part in sorted(parts, key=lambda p: p['part']))
+        keyboard = [
+            [InlineKeyboardButton("🔍 Проверить", callback_data="restore_verify"),
+             InlineKeyboardButton("♻️ Восстановить", callback_data="restore_extract")],
+            [InlineKeyboardButton("🗑 Сбросить", callback_data="restore_clear")],
+        ]
+        await update.message.reply_text(
+            f"📦 Получено частей: {len(parts)}\n<code>{names}</code>\n\n"
+            f"Если частей несколько, пришлите остальные, затем выберите действие.\n"
+            f"Итерации можно указать командой <code>/verify N</code> или <code>/restore N</code>.",
+            reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML'
+        )
+
+    async def verify_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /verify [итерации] - проверка присланного архива без записи на диск"""
+        await self._restore_command(update, context, extract=False)
+
+    async def restore_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /restore [итерации] - распаковка присланного архива в RESTORE_FOLDER"""
+        await self._restore_command(update, context, extract=True)
+
+    async def _restore_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE, extract: bool):
+        if not self._is_allowed(update.effective_user.id):
+            await update.message.reply_text("❌ У вас нет доступа к этому боту.")
+            return
+        iterations = None
+        if context.args:
+            try: iterations = int(context.args[0])
+            except ValueError:
+                await update.message.reply_text("❌ Количество итераций должно быть числом.")
+                return
+        await self.run_restore(context, update.effective_chat.id, extract, iterations)
+
+    async def handle_restore_button(self, query, context: ContextTypes.DEFAULT_TYPE):
+        if not self._is_allowed(query.from_user.id):
+            return
+        if query.data == "restore_clear":
+            context.user_data.pop('restore_parts', None)
+            await query.edit_message_text("🗑 Присланные части архива сброшены.")
+            return
+        await query.edit_message_reply_markup(reply_markup=None)
+        await self.run_restore(context, query.message.chat_id, extract=query.data == "restore_extract")
+
+    async def run_restore(self, context: ContextTypes.DEFAULT_TYPE, chat_id: int, extract: bool,
+                          iterations: Optional[int] = None):
+        """
+        Скачивает присланные части потоком, расшифровывает и проверяет CRC каждой записи zip.
+        Архив .dtga сначала сохраняется во временный файл (нужен произвольный доступ) и
+        проверяется посегментно; итерации берутся из его заголовка.
+        При extract=True распаковывает в RESTORE_FOLDER (только если проверка прошла целиком).
+        """
+        parts = sorted(context.user_data.get('restore_parts', []), key=lambda p: p['part'])
+        if not parts:
+            await context.bot.send_message(chat_id, "📦 Сначала пришлите файл <code>.zip.enc</code> или <code>.dtga</code> (или его части).", parse_mode='HTML')
+            return
+        if not AESGCMCipher or not self.enc_password:
+            await context.bot.send_message(chat_id, "❌ Ошибка: Пароль шифрования (ENCRYPTION_PASSWORD) не задан в .env.", parse_mode='HTML')
+            return
+
+        action = "Восстановление" if extract else "Проверка"
+        message = await context.bot.send_message(chat_id, f"⏳ {action} архива <code>{self._escape_html(parts[0]['base'])}</code>...", parse_mode='HTML')
+
+        try:
+            # Файлы больше 20 МБ доступны только через локальный Bot API (BOT_API_URL)
+            sources = [(await context.bot.get_file(part['file_id'])).file_path for part in parts]
+        except TelegramError as e:
+            await message.edit_text(f"❌ Не удалось получить файл: {self._escape_html(e)}", parse_mode='HTML')
+            return
+
+        if iterations is None:
+            iterations = calculate_iterations_from_password(self.enc_password, self.iter_password)
+        password = self.enc_password.encode('utf-8')
+
+        extract_to = None
+        if extract:
+            base = re.sub(r'\.(zip\.enc|tar\.enc|dtga)$', '', parts[0]['base'])
+            timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+            os.makedirs(self.restore_folder, exist_ok=True)
+            extract_to = os.path.join(self.restore_folder, f"{os.path.basename(base)}-restored-{timestamp}")
+
+        try:
+            if parts[0]['base'].endswith(ARCHIVE_SUFFIX):
+                report = await asyncio.to_thread(self._verify_indexed, sources, password, extract_to)
+            else:
+                report = await asyncio.to_thread(
+                    verify_or_restore, iter_sources(sources),
+                    lambda salt: derive_key(password, salt, iterations), extract_to
+                )
+        except Exception as e:
+            await message.edit_text(f"❌ {action} не удалась: <code>{self._escape_html(e)}</code>", parse_mode='HTML')
+            return
+        context.user_data.pop('restore_parts', None)
+
+        text, full_report = self._format_restore_report(report, action, extract_to)
+        await message.edit_text(text, parse_mode='HTML')
+        if full_report:
+            await context.bot.send_document(chat_id, document=full_report.encode('utf-8'), filename="restore-report.txt")
+
+    def _verify_indexed(self, sources: list, password: bytes, extract_to: Optional[str]) -> dict:
+        """Архив .dtga: локальный файл (локальный Bot API) проверяется на месте, иначе части скачиваются во временный файл."""
+        if len(sources) == 1 and os.path.isfile(sources[0]):
+            return verify_or_restore_archive(sources[0], password, extract_to)
+        os.makedirs(self.restore_folder, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix=ARCHIVE_SUFFIX, dir=self.restore_folder)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in iter_sources(sources):
+                    out.write(chunk)
+            return verify_or_restore_archive(temp_path, password, extract_to)
+        finally:
+            os.remove(temp_path)
+
+    def _format_restore_report(self, report: dict, action: str, extract_to: Optional[str]):
+        """Возвращает (HTML-сообщение, полный текстовый отчёт или None, если всё поместилось)"""
+        entries = report['entries']
+        ok_count = sum(1 for entry in entries if entry['ok'])
+        speed = report['bytes'] / report['seconds'] / 1e6 if report['seconds'] else 0
+
+        lines = [
+            f"{'✅' if entry['ok'] else '❌'} {entry['name']} — {entry['size']} байт, "
+            f"{entry['seconds']:.2f} сек{'' if entry['ok'] else ' — ' + entry['error']}"
+            for entry in entries
+        ]
+
+        header = f"{'✅' if report['ok'] else '❌'} <b>{action}: {'успешно' if report['ok'] else 'ошибка'}</b>\n\n"
+        if report['error']:
+            header += f"Ошибка: <code>{self._escape_html(report['error'])}</code>\n"
+        header += (
+            f"Файлов: {ok_count}/{len(entries)} без ошибок\n"
+            f"Объём: {report['bytes'] / 1e6:.1f} МБ за {report['seconds']:.1f} сек ({speed:.1f} МБ/с)\n"
+        )
+        if report['ok'] and extract_to:
+            header += f"Распаковано в: <code>{self._escape_html(extract_to)}</code>\n"
+
+        # Сначала показываем записи с ошибками
+        shown = sorted(lines, key=lambda line: not line.startswith('❌'))[:RESTORE_REPORT_LINES]
+        text = header + "\n<pre>" + self._escape_html("\n".join(shown)) + "</pre>" if shown else header
+        if len(lines) <= RESTORE_REPORT_LINES:
+            return text, None
+        text += f"\n... и ещё {len(lines) - RESTORE_REPORT_LINES}, полный отчёт в файле"
+        return text, "\n".join(lines)
+
     async def show_containers(self, query):
         """Display the list of containers including status, image, and uptime."""
-        if not self.docker_client:
+        containers, errors = await self.get_containers()
+
+        if not containers and errors and len(errors) == len(self.docker_hosts):
             await query.edit_message_text("❌ Docker клиент недоступен для управления контейнерами.", parse_mode='HTML')
             return await self.start_menu(query)
 
-        containers = await self.get_containers()
-
-        if not containers:
+        if not containers and not errors:
             await query.edit_message_text("📋 Контейнеры не найдены", parse_mode='HTML')
             return
 
+        multi_host = len(self.docker_hosts) > 1
         message = "📋 <b>Список контейнеров:</b>\n\n"
         keyboard = []
 
+        for host_name, error in errors.items():
+            message += f"⚠️ <b>{self._escape_html(host_name)}</b>: {self._escape_html(error)}\n\n"
+
+        current_host = None
         for container in containers:
+            if multi_host and container['host'] != current_host:
+                current_host = container['host']
+                message += f"🖥 <b>{self._escape_html(current_host)}</b>\n"
             status = container['status']
             started_at = container.get('started_at')
 
@@ -318,10 +790,11 @@ class DockerBot:
             message += f"    Образ: {escaped_image}\n"
             message += f"    Время работы: {uptime_str}\n\n"
 
+            label = f"{container['host']}/{container['name']}" if multi_host else container['name']
             keyboard.append([
                 InlineKeyboardButton(
-                    f"{'⏹️' if status == 'running' else '▶️'} {container['name']}",
-                    callback_data=f"container_{container['name']}"
+                    f"{'⏹️' if status == 'running' else '▶️'} {label}",
+                    callback_data=f"container_{self._container_ref(container['host'], container['name'])}"
                 )
             ])
 
@@ -332,40 +805,55 @@ class DockerBot:
         await query.edit_message_text(message, reply_markup=reply_markup, parse_mode='HTML')
 
 
-    async def show_container_info(self, query, container_name: Optional[str] = None):
+    async def show_container_info(self, query, container_ref: Optional[str] = None):
         """Показать информацию о контейнере."""
-        if not self.docker_client: return await self.start_menu(query)
-        
         # ⬇️ ИСПРАВЛЕНИЕ 1 (часть 2): Парсим имя, если оно не было передано явно
-        if not container_name:
-            try: container_name = query.data.split("_", 1)[1]
+        if not container_ref:
+            try: container_ref = query.data.split("_", 1)[1]
             except IndexError:
                 await query.edit_message_text("❌ Ошибка: Неверный формат данных для контейнера.", parse_mode='HTML')
                 return
-
         try:
-            container = self.docker_client.containers.get(container_name)
-            status = container.status
+            host_name, container_name = await self._resolve_container_ref(container_ref)
+        except KeyError as e:
+            await query.edit_message_text(f"❌ {self._escape_html(e.args[0])}", parse_mode='HTML')
+            return
 
+        def fetch(client):
+            container = client.containers.get(container_name)
             if container.image.tags: image_tag = container.image.tags[0]
             else: image_tag = container.image.short_id
+            return container.status, image_tag
+
+        try:
+            host = self.docker_hosts.get(host_name)
+            status, image_tag = await host.call(fetch)
+            container_ref = self._container_ref(host.name, container_name)
 
             escaped_name = self._escape_html(container_name)
             escaped_image = self._escape_html(image_tag)
             
             message = f"🐳 <b>{escaped_name}</b>\n\n"
+            if len(self.docker_hosts) > 1:
+                message += f"Хост: {self._escape_html(host.name)}\n"
             message += f"Статус: {status}\n"
             message += f"Образ: <code>{escaped_image}</code>\n\n"
 
             keyboard = []
 
             if status == 'running':
-                keyboard.append([InlineKeyboardButton("⏹️ Остановить", callback_data=f"action_stop_{container_name}")])
-                keyboard.append([InlineKeyboardButton("🔄 Перезапустить", callback_data=f"action_restart_{container_name}")])
+                keyboard.append([InlineKeyboardButton("⏹️ Остановить", callback_data=f"action_stop_{container_ref}")])
+                keyboard.append([InlineKeyboardButton("🔄 Перезапустить", callback_data=f"action_restart_{container_ref}")])
             else:
-                keyboard.append([InlineKeyboardButton("▶️ Запустить", callback_data=f"action_start_{container_name}")])
+                keyboard.append([InlineKeyboardButton("▶️ Запустить", callback_data=f"action_start_{container_ref}")])
 
-            keyboard.append([InlineKeyboardButton("📝 Логи", callback_data=f"action_logs_{container_name}")])
+            keyboard.append([InlineKeyboardButton("📝 Логи", callback_data=f"action_logs_{container_ref}")])
+            if status == 'running' and self.exec_commands:
+                exec_buttons = [
+                    InlineKeyboardButton(f"💻 {name}", callback_data=f"exec_{name}:{container_ref}")
+                    for name in self.exec_commands
+                ]
+                keyboard.extend(exec_buttons[i:i + 3] for i in range(0, len(exec_buttons), 3))
             keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="list")])
 
             reply_markup = InlineKeyboardMarkup(keyboard)
@@ -378,27 +866,30 @@ class DockerBot:
 
     async def handle_action(self, query):
         """Обработка действий с контейнерами"""
-        if not self.docker_client: return await self.start_menu(query)
-        
         data = query.data.split("_")
         action = data[1]
-        container_name = "_".join(data[2:])
+        container_ref = "_".join(data[2:])
+        try:
+            host_name, container_name = await self._resolve_container_ref(container_ref)
+        except KeyError as e:
+            await query.edit_message_text(f"❌ {self._escape_html(e.args[0])}", parse_mode='HTML')
+            return
         escaped_name = self._escape_html(container_name)
 
         if action == "start":
-            success = await self.start_container(container_name)
+            success = await self.start_container(host_name, container_name)
             if success: await query.edit_message_text(f"✅ Контейнер <code>{escaped_name}</code> запущен", parse_mode='HTML')
             else: await query.edit_message_text(f"❌ Ошибка при запуске контейнера <code>{escaped_name}</code>", parse_mode='HTML')
         elif action == "stop":
-            success = await self.stop_container(container_name)
+            success = await self.stop_container(host_name, container_name)
             if success: await query.edit_message_text(f"⏹️ Контейнер <code>{escaped_name}</code> остановлен", parse_mode='HTML')
             else: await query.edit_message_text(f"❌ Ошибка при остановке контейнера <code>{escaped_name}</code>", parse_mode='HTML')
         elif action == "restart":
-            success = await self.restart_container(container_name)
+            success = await self.restart_container(host_name, container_name)
             if success: await query.edit_message_text(f"🔄 Контейнер <code>{escaped_name}</code> перезапущен", parse_mode='HTML')
             else: await query.edit_message_text(f"❌ Ошибка при перезапуске контейнера <code>{escaped_name}</code>", parse_mode='HTML')
         elif action == "logs":
-            logs = await self.get_container_logs(container_name, 20)
+            logs = await self.get_container_logs(host_name, container_name, 20)
             
             if len(logs) > 3000: logs = logs[-3000:] + "\n\n... (показаны последние 20 строк)"
 
@@ -406,7 +897,7 @@ class DockerBot:
             message = f"📝 <b>Логи <code>{escaped_name}</code>:</b>\n\n<pre>{escaped_logs}</pre>"
             
             # Кнопка "Назад" ведет обратно в меню контейнера
-            keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data=f"container_{container_name}")]]
+            keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data=f"container_{container_ref}")]]
             reply_markup = InlineKeyboardMarkup(keyboard)
 
             await query.edit_message_text(message, reply_markup=reply_markup, parse_mode='HTML')
@@ -415,23 +906,193 @@ class DockerBot:
         if action in ["start", "stop", "restart"]:
             await asyncio.sleep(1) # Ждем, пока Docker обновит статус
             # Вызываем show_container_info с именем контейнера
-            await self.show_container_info(query, container_name)
+            await self.show_container_info(query, container_ref)
         
         # ВНИМАНИЕ: Старый код, вызывающий self.start_menu(query), удален.
 
+    # --- Выполнение команд в контейнерах ---
+
+    async def handle_exec_button(self, query, context: ContextTypes.DEFAULT_TYPE):
+        """Кнопка команды на карточке контейнера: exec_<команда>:<хост>/<контейнер>"""
+        if not self._is_allowed(query.from_user.id):
+            await context.bot.send_message(query.message.chat_id, "❌ У вас нет доступа к этому боту.")
+            return
+
+        command_name, _, container_ref = query.data[len("exec_"):].partition(":")
+        if command_name not in self.exec_commands:
+            await context.bot.send_message(query.message.chat_id, "❌ Команда не разрешена (EXEC_COMMANDS).")
+            return
+        try:
+            host_name, container_name = await self._resolve_container_ref(container_ref)
+        except KeyError as e:
+            await context.bot.send_message(query.message.chat_id, f"❌ {self._escape_html(e.args[0])}")
+            return
+        # Команда может выполняться до EXEC_TIMEOUT: не задерживаем остальные нажатия на этом сообщении
+        context.application.create_task(
+            self.run_exec_command(context, query.message.chat_id, host_name, container_name, command_name)
+        )
+
+    async def run_exec_command(self, context: ContextTypes.DEFAULT_TYPE, chat_id: int, host_name: Optional[str],
+                               container_name: str, command_name: str):
+        """
+        Выполняет команду в потоке и показывает вывод в отдельном сообщении, редактируя его
+        не чаще EXEC_EDIT_INTERVAL. Вывод ограничен EXEC_MAX_OUTPUT, время - EXEC_TIMEOUT
+        (при EXEC_KILL=timeout процесс завершается в самом контейнере); длинный вывод
+        отправляется файлом .txt.gz.
+        """
+        argv = self.exec_commands[command_name]
+        kill = self.exec_kill == "timeout"
+        exec_argv = with_kill_timeout(argv, self.exec_timeout) if kill else argv
+        read_timeout = self.exec_timeout + (EXEC_KILL_GRACE if kill else 0)
+        title = (f"💻 <code>{self._escape_html(shlex.join(argv))}</code> в "
+                 f"<code>{self._escape_html(container_name)}</code>")
+        message = await context.bot.send_message(chat_id, f"{title}\n\n⏳ Ожидание...", parse_mode='HTML')
+
+        async with self.exec_slots:
+            started = time.perf_counter()
+            output = ExecOutput(self.exec_max_output)
+            cancel = threading.Event()
+
+            def run():
+                host = self.docker_hosts.get(host_name)
+                return run_exec(host.streaming_api(read_timeout), container_name, exec_argv, output, cancel)
+
+            task = asyncio.ensure_future(asyncio.to_thread(run))
+            deadline = started + read_timeout
+            shown_version = 0
+            while not task.done():
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    cancel.set()
+                    break
+                await asyncio.wait({task}, timeout=min(self.exec_edit_interval, remaining))
+                if not task.done() and output.version != shown_version:
+                    shown_version = output.version
+                    await self._edit_exec_message(context, message, title, output, "⏳ Выполняется...")
+
+            if not task.done():
+                status = "⏱ Превышено время выполнения (EXEC_TIMEOUT), вывод прерван"
+            elif task.exception():
+                error = task.exception()
+                if isinstance(error, docker.errors.NotFound):
+                    status = "❌ Контейнер не найден"
+                else:
+                    status = f"❌ Ошибка: {self._escape_html(error)}"
+            elif task.result() is None:
+                status = "✂️ Превышен размер вывода (EXEC_MAX_OUTPUT), вывод прерван"
+            elif kill and task.result() in (124, 137):
+                status = f"⏱ Превышено время выполнения (EXEC_TIMEOUT), команда завершена (код {task.result()})"
+            elif kill and task.result() in (126, 127):
+                status = f"⚠️ Код выхода: {task.result()} (нет команды или утилиты timeout в образе? см. EXEC_KILL)"
+            else:
+                status = f"{'✅' if task.result() == 0 else '⚠️'} Код выхода: {task.result()}"
+            status += f" ({time.perf_counter() - started:.1f} сек)"
+            await self._edit_exec_message(context, message, title, output, status)
+
+            if output.total > EXEC_PREVIEW_CHARS:
+                timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+                await context.bot.send_document(
+                    chat_id=chat_id,
+                    document=gzip.compress(output.getvalue()),
+                    filename=f"exec-{container_name}-{command_name}-{timestamp}.txt.gz",
+                    caption=f"{title}: полный вывод" + (" (обрезан по EXEC_MAX_OUTPUT)" if output.truncated else ""),
+                    parse_mode='HTML'
+                )
+            # Поток чтения завершится на следующем блоке вывода или по таймауту чтения;
+            # до этого он занимает слот, чтобы число потоков оставалось ограниченным
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _edit_exec_message(self, context: ContextTypes.DEFAULT_TYPE, message, title: str,
+                                 output: ExecOutput, status: str):
+        text = output.tail(EXEC_PREVIEW_CHARS)
+        body = f"<pre>{self._escape_html(text)}</pre>" if text else "<i>(нет вывода)</i>"
+        if output.total > EXEC_PREVIEW_CHARS:
+            body += f"\n... показаны последние {EXEC_PREVIEW_CHARS} символов"
+        try:
+            await context.bot.edit_message_text(
+                chat_id=message.chat_id,
+                message_id=message.message_id,
+                text=f"{title}\n\n{body}\n\n{status}",
+                parse_mode='HTML'
+            )
+        except TelegramError as e:
+            # "Message is not modified" и временные ошибки не прерывают выполнение команды
+            print(f"Не удалось обновить вывод команды: {e}")
+
+    def build_application(self) -> Application:
+        """Собирает Application с общей для обоих режимов очередью обновлений"""
+        builder = Application.builder().token(self.bot_token)
+        builder = builder.update_queue(TimestampedUpdateQueue(self.latency))
+        builder = builder.concurrent_updates(
+            OrderedUpdateProcessor(self.max_concurrent_updates, self.update_order_key)
+        )
+        if self.bot_api_url:
+            builder = builder.base_url(f"{self.bot_api_url}/bot").base_file_url(f"{self.bot_api_url}/file/bot")
+        application = builder.build()
+
+        application.add_handler(TypeHandler(Update, self.track_latency), group=-1)
+        application.add_handler(CommandHandler("start", self.start))
+        application.add_handler(CommandHandler("stats", self.stats))
+        application.add_handler(CommandHandler("verify", self.verify_command))
+        application.add_handler(CommandHandler("restore", self.restore_command))
+        application.add_handler(MessageHandler(filters.Document.ALL, self.receive_backup_part))
+        application.add_handler(CallbackQueryHandler(self.button_handler))
+        return application
+
+    async def run_webhook(self, application: Application):
+        """Webhook-режим: собственный HTTP-приёмник вместо long polling"""
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass # Windows: остановка через KeyboardInterrupt
+
+        server = WebhookServer(
+            application, self.webhook_listen, self.webhook_port,
+            self.webhook_path, self.webhook_secret
+        )
+
+        async with application:
+            await application.start()
+            await server.start()
+            try:
+                await application.bot.set_webhook(
+                    url=self.webhook_url,
+                    secret_token=self.webhook_secret,
+                    max_connections=self.webhook_max_connections,
+                    allowed_updates=Update.ALL_TYPES,
+                )
+                print("Бот запущен (webhook)...")
+                await stop_event.wait()
+            finally:
+                # Сначала перестаём принимать и дожидаемся уже принятых запросов,
+                # затем Application.stop() обрабатывает оставшиеся в очереди обновления
+                await server.stop(self.webhook_drain_timeout)
+                await application.stop()
+
     def run(self):
         """Запуск бота"""
         if not self.bot_token:
             print("❌ BOT_TOKEN не найден. Установите его в файле .env")
             return
-            
-        application = Application.builder().token(self.bot_token).build()
 
-        application.add_handler(CommandHandler("start", self.start))
-        application.add_handler(CallbackQueryHandler(self.button_handler))
+        application = self.build_application()
+
+        if self.update_mode == "webhook":
+            if not self.webhook_url:
+                print("❌ UPDATE_MODE=webhook, но WEBHOOK_URL не задан в .env")
+                return
+            asyncio.run(self.run_webhook(application))
+        else:
+            print("Бот запущен...")
+            application.run_polling(allowed_updates=Update.ALL_TYPES)
 
-        print("Бот запущен...")
-        application.run_polling()
+        self.docker_hosts.close()
+        if self.key_pool:
+            self.key_pool.close()
+        print(f"Задержка обработки обновлений: {self.latency.format_summary()}")
 
 if __name__ == "__main__":
     try:
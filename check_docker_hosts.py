@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Проверка DockerHosts на локальных поддельных Docker-демонах, без настоящего Docker.
+
+Поднимаются три хоста:
+    healthy  - отвечает сразу и отдаёт два контейнера;
+    slow     - отвечает на любой запрос через SLOW_DELAY секунд (дольше таймаута);
+    refusing - порт, на котором никто не слушает (соединение отклоняется).
+
+Проверяется, что ping_all() и gather() возвращают результат здорового хоста и ошибки
+двух других, и что медленный хост не задерживает ответ дольше таймаута.
+
+    python check_docker_hosts.py [--timeout 1]
+
+Код выхода 0 - все проверки пройдены, 1 - нет.
+"""
+import argparse
+import asyncio
+import json
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from docker_hosts import DockerHosts
+
+API_VERSION = "1.43"
+SLOW_DELAY = 5
+CONTAINERS = [
+    {"Id": "a" * 64, "Names": ["/web"], "Image": "nginx:latest", "State": "running", "Status": "Up 1 hour"},
+    {"Id": "b" * 64, "Names": ["/db"], "Image": "postgres:16", "State": "exited", "Status": "Exited (0)"},
+]
+
+
+def _handler(delay: float):
+    class FakeDockerHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, payload, code: int = 200):
+            body = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            time.sleep(delay)
+            path = self.path.split('?')[0]
+            # Путь без префикса версии API (/v1.43/...)
+            if path.startswith('/v'):
+                path = '/' + path.split('/', 2)[-1]
+            if path == '/version':
+                return self._send({"ApiVersion": API_VERSION, "Version": "fake"})
+            if path == '/_ping':
+                return self._send(b"OK")
+            if path == '/containers/json':
+                return self._send(CONTAINERS)
+            for container in CONTAINERS:
+                if path == f"/containers/{container['Id']}/json":
+                    return self._send({
+                        "Id": container['Id'], "Name": container['Names'][0],
+                        "State": {"Status": container['State']}, "Config": {"Image": container['Image']},
+                    })
+            self._send({"message": "not found"}, 404)
+
+    return FakeDockerHandler
+
+
+def start_daemon(delay: float = 0) -> tuple:
+    """Поддельный демон на свободном порту в фоновом потоке. Возвращает (сервер, адрес)."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _handler(delay))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"tcp://127.0.0.1:{server.server_address[1]}"
+
+
+def refusing_address() -> str:
+    """Адрес свободного порта, на котором никто не слушает."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f"tcp://127.0.0.1:{port}"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Проверка DockerHosts на поддельных Docker-демонах")
+    parser.add_argument("--timeout", type=float, default=1, help="DOCKER_TIMEOUT для проверки, сек")
+    args = parser.parse_args(argv)
+
+    healthy, healthy_url = start_daemon()
+    slow, slow_url = start_daemon(SLOW_DELAY)
+    spec = f"healthy={healthy_url},slow={slow_url},refusing={refusing_address()}"
+    hosts = DockerHosts(spec, timeout=args.timeout, pool_size=2)
+    failures = []
+
+    def check(condition: bool, description: str):
+        print(f"{'OK  ' if condition else 'FAIL'} {description}")
+        if not condition:
+            failures.append(description)
+
+    try:
+        started = time.perf_counter()
+        status = hosts.ping_all()
+        elapsed = time.perf_counter() - started
+        check(status['healthy'] is None, f"ping_all: healthy доступен ({status['healthy']})")
+        check(status['slow'] is not None, f"ping_all: slow - ошибка ({status['slow']})")
+        check(status['refusing'] is not None, f"ping_all: refusing - ошибка ({status['refusing']})")
+        check(elapsed < args.timeout + 1, f"ping_all занял {elapsed:.2f} сек (таймаут {args.timeout:g})")
+
+        async def gather_containers():
+            return await hosts.gather(lambda client: [c.name for c in client.containers.list(all=True)])
+
+        started = time.perf_counter()
+        results, errors = asyncio.run(gather_containers())
+        elapsed = time.perf_counter() - started
+        check(results.get('healthy') == ["web", "db"], f"gather: контейнеры healthy {results.get('healthy')}")
+        check(set(errors) == {'slow', 'refusing'}, f"gather: ошибки {errors}")
+        check(elapsed < args.timeout + 1, f"gather занял {elapsed:.2f} сек (таймаут {args.timeout:g})")
+    finally:
+        hosts.close()
+        healthy.shutdown()
+        slow.shutdown()
+
+    print("Все проверки пройдены" if not failures else f"Не пройдено проверок: {len(failures)}")
+    return 0 if not failures else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Проверка архива с индексом (indexed_archive.py) на папке с необычными записями.
+
+В исходной папке создаются:
+    обычные файлы (в том числе во вложенной папке);
+    символическая ссылка на обычный файл - архивируется как файл, как в zip-бэкапе;
+    битая символическая ссылка - пропускается;
+    FIFO - пропускается (чтение из него заблокировало бы бэкап навсегда).
+
+Проверяется, что запись завершается за WRITE_TIMEOUT секунд, в индексе ровно
+ожидаемые файлы, а восстановленные файлы совпадают с исходными.
+
+    python check_indexed_archive.py
+
+Код выхода 0 - все проверки пройдены, 1 - нет.
+"""
+import os
+import sys
+import tempfile
+import threading
+
+from indexed_archive import IndexedArchive, write_archive
+
+PASSWORD = b"check-indexed-archive"
+ITERATIONS = 1000
+WRITE_TIMEOUT = 10
+
+
+def build_tree(root: str) -> dict:
+    """Создаёт исходную папку. Возвращает {путь в архиве: содержимое} для ожидаемых файлов."""
+    folder = os.path.join(root, "data")
+    os.makedirs(os.path.join(folder, "sub"))
+    files = {
+        "data/config.yml": b"key: value\n",
+        "data/sub/big.bin": os.urandom(3 * 1024 * 1024 + 17),
+    }
+    for name, content in files.items():
+        with open(os.path.join(root, name), 'wb') as f:
+            f.write(content)
+    os.symlink("config.yml", os.path.join(folder, "link-to-config.yml"))
+    files["data/link-to-config.yml"] = files["data/config.yml"]
+    os.symlink("missing-target", os.path.join(folder, "dangling"))
+    os.mkfifo(os.path.join(folder, "pipe"))
+    return files
+
+
+def main() -> int:
+    failures = []
+
+    def check(condition: bool, description: str):
+        print(f"{'OK  ' if condition else 'FAIL'} {description}")
+        if not condition:
+            failures.append(description)
+
+    with tempfile.TemporaryDirectory() as root:
+        expected = build_tree(root)
+        archive_path = os.path.join(root, "backup.dtga")
+        outcome = {}
+
+        def write():
+            try:
+                outcome['stats'] = write_archive(os.path.join(root, "data"), archive_path, PASSWORD, ITERATIONS)
+            except Exception as e:
+                outcome['error'] = e
+
+        # Поток-демон: если запись зависнет на FIFO, проверка всё равно завершится
+        writer = threading.Thread(target=write, daemon=True)
+        writer.start()
+        writer.join(WRITE_TIMEOUT)
+        check(not writer.is_alive(), f"запись завершилась за {WRITE_TIMEOUT} сек")
+        check('error' not in outcome, f"запись без ошибок ({outcome.get('error')})")
+
+        if 'stats' in outcome:
+            with IndexedArchive(archive_path, PASSWORD) as archive:
+                names = sorted(entry['p'] for entry in archive.entries if entry['t'] == 'f')
+                check(names == sorted(expected), f"файлы в индексе: {names}")
+                restored = os.path.join(root, "restored")
+                results = archive.extract(restored)
+            check(all(result['ok'] for result in results), "все файлы восстановлены")
+            for name, content in expected.items():
+                path = os.path.join(restored, name)
+                same = os.path.isfile(path) and open(path, 'rb').read() == content
+                check(same, f"{name} совпадает с исходным")
+
+    print("Все проверки пройдены" if not failures else f"Не пройдено проверок: {len(failures)}")
+    return 0 if not failures else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,29 @@
 import base64
-from Crypto.Cipher import AES
-from Crypto.Protocol.KDF import PBKDF2
 from Crypto.Random import get_random_bytes
 import random
 import struct
 import hashlib
-from typing import Optional
+import os
+from typing import BinaryIO, Callable, Optional
+
+# PBKDF2 и AES-GCM берутся из выбранной реализации (hashlib/pycryptodome/cryptography),
+# результат побайтово одинаков
+import crypto_backends
+
+# Формат пакета: salt (16) + nonce (16) + ciphertext + tag (16)
+SALT_SIZE = 16
+NONCE_SIZE = 16
+TAG_SIZE = 16
+HEADER_SIZE = SALT_SIZE + NONCE_SIZE
+
+MIN_ITERATIONS = 5000000
+MAX_ITERATIONS = 6000000
+
+# Размер блока для потокового шифрования файлов
+CHUNK_SIZE = 1024 * 1024
+
+# progress(обработано_байт, всего_байт). Может бросить исключение, чтобы прервать операцию
+ProgressCallback = Callable[[int, int], None]
 
 # ================== Класс шифрования ==================
 
@@ -21,13 +39,109 @@ def calculate_iterations_from_password(password: str, iterations_password: str)
     # Используем >I для Big-endian беззнакового int (4 байта)
     hash_int = struct.unpack('>I', hash_value[:4])[0]
     
-    min_iter = 5000000
-    max_iter = 6000000
+    min_iter = MIN_ITERATIONS
+    max_iter = MAX_ITERATIONS
     
     # Детерминированное определение итераций в заданном диапазоне
     iterations = min_iter + (hash_int % (max_iter - min_iter + 1))
     return iterations
 
+def derive_key(password: bytes, salt: bytes, iterations: int) -> bytes:
+    """PBKDF2 (HMAC-SHA1) -> 32-байтовый ключ AES-256."""
+    return crypto_backends.derive_key(password, salt, iterations)
+
+def _stream_size(stream: BinaryIO) -> int:
+    """Размер seekable-потока от текущей позиции до конца (позиция не меняется)."""
+    position = stream.tell()
+    end = stream.seek(0, os.SEEK_END)
+    stream.seek(position)
+    return end - position
+
+def encrypt_stream_with_key(key: bytes, salt: bytes, src: BinaryIO, dst: BinaryIO,
+                            progress: Optional[ProgressCallback] = None, total: int = 0) -> None:
+    """
+    Потоково шифрует src в dst уже выведенным ключом. Формат совпадает с encrypt():
+    salt + nonce + ciphertext + tag. Память — O(CHUNK_SIZE).
+    """
+    cipher = crypto_backends.new_gcm(key, get_random_bytes(NONCE_SIZE))
+    dst.write(salt + cipher.nonce)
+    done = 0
+    for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+        dst.write(cipher.encrypt(chunk))
+        done += len(chunk)
+        if progress:
+            progress(done, total)
+    dst.write(cipher.digest())
+
+def decrypt_stream_with_key(key: bytes, src: BinaryIO, dst: BinaryIO,
+                            progress: Optional[ProgressCallback] = None) -> None:
+    """
+    Потоково расшифровывает пакет из seekable src (с текущей позиции до конца) в dst.
+    Тег проверяется только в конце, поэтому при ValueError записанное в dst
+    необходимо отбросить.
+    """
+    total = _stream_size(src)
+    if total < HEADER_SIZE + TAG_SIZE:
+        raise ValueError("Слишком короткий пакет")
+    start = src.tell()
+    src.seek(start + total - TAG_SIZE)
+    tag = src.read(TAG_SIZE)
+    src.seek(start + SALT_SIZE)
+    nonce = src.read(NONCE_SIZE)
+
+    cipher = crypto_backends.new_gcm(key, nonce)
+    remaining = total - HEADER_SIZE - TAG_SIZE
+    done = 0
+    while remaining:
+        chunk = src.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            raise ValueError("Неожиданный конец файла")
+        remaining -= len(chunk)
+        dst.write(cipher.decrypt(chunk))
+        done += len(chunk)
+        if progress:
+            progress(done, total)
+    cipher.verify(tag)
+
+class EncryptingWriter:
+    """
+    Файлоподобный объект только для записи: всё записанное шифруется и пишется в dst
+    в формате encrypt() (salt + nonce + ciphertext + tag). Подходит как приёмник для
+    zipfile/tarfile, чтобы архив шифровался на лету без временного файла.
+    Тег дописывается в close().
+    """
+
+    def __init__(self, key: bytes, salt: bytes, dst: BinaryIO):
+        self._dst = dst
+        self._cipher = crypto_backends.new_gcm(key, get_random_bytes(NONCE_SIZE))
+        self._buffer = bytearray()
+        self.closed = False
+        self.bytes_written = 0
+        dst.write(salt + self._cipher.nonce)
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("Запись в закрытый EncryptingWriter")
+        # zipfile пишет мелкими порциями - шифруем блоками по CHUNK_SIZE
+        self._buffer += data
+        if len(self._buffer) >= CHUNK_SIZE:
+            self._dst.write(self._cipher.encrypt(bytes(self._buffer)))
+            self._buffer.clear()
+        self.bytes_written += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self._buffer:
+            self._dst.write(self._cipher.encrypt(bytes(self._buffer)))
+            self._buffer.clear()
+        self._dst.write(self._cipher.digest())
+
 class AESGCMCipher:
     def __init__(self, password: str, iterations_password: str = ""):
         self.password = password.encode('utf-8')
@@ -35,19 +149,13 @@ class AESGCMCipher:
 
     def _get_encryption_key(self, salt: bytes, iterations: int) -> bytes:
         """Получает ключ из пароля, соли и итераций."""
-        # dkLen=32 для AES-256
-        return PBKDF2(self.password, salt, dkLen=32, count=iterations)
+        return derive_key(self.password, salt, iterations)
 
-    def encrypt(self, data: bytes, iterations: Optional[int] = None) -> (bytes, int):
+    def resolve_iterations(self, iterations: Optional[int] = None) -> int:
         """
-        Шифрует данные. Если итерации не заданы, использует случайное число
-        или вычисляет его из пароля и пароля для итераций, если он задан.
-        
-        Возвращает: (зашифрованный пакет, использованное количество итераций)
+        Количество итераций для шифрования: детерминированное из паролей, если задан
+        пароль для итераций, иначе явно заданное, иначе случайное.
         """
-        salt = get_random_bytes(16)
-        
-        # Определяем количество итераций для шифрования
         actual_iterations = 0
         iterations_password_str = self.iterations_password.decode('utf-8')
         
@@ -59,16 +167,40 @@ class AESGCMCipher:
             )
         elif iterations is not None:
             # Если явно задано
-            if iterations < 5000000:
+            if iterations < MIN_ITERATIONS:
                 raise ValueError("Количество итераций должно быть не менее 5 000 000!")
             actual_iterations = iterations
         else:
             # Иначе - случайное, как в GUI при пустом поле
-            actual_iterations = random.randint(5000000, 6000000)
+            actual_iterations = random.randint(MIN_ITERATIONS, MAX_ITERATIONS)
+        return actual_iterations
+
+    def candidate_iterations(self, preferred_iterations: Optional[int]) -> list:
+        """
+        Итерации для попыток расшифровки: сначала preferred, затем детерминированные.
+        Без preferred - только детерминированные.
+        """
+        deterministic = calculate_iterations_from_password(
+            self.password.decode('utf-8'),
+            self.iterations_password.decode('utf-8')
+        )
+        if preferred_iterations is None or preferred_iterations == deterministic:
+            return [deterministic]
+        return [preferred_iterations, deterministic]
+
+    def encrypt(self, data: bytes, iterations: Optional[int] = None) -> (bytes, int):
+        """
+        Шифрует данные. Если итерации не заданы, использует случайное число
+        или вычисляет его из пароля и пароля для итераций, если он задан.
+        
+        Возвращает: (зашифрованный пакет, использованное количество итераций)
+        """
+        salt = get_random_bytes(SALT_SIZE)
+        actual_iterations = self.resolve_iterations(iterations)
 
         key = self._get_encryption_key(salt, actual_iterations)
 
-        cipher = AES.new(key, AES.MODE_GCM)
+        cipher = crypto_backends.new_gcm(key, get_random_bytes(NONCE_SIZE))
         ciphertext, tag = cipher.encrypt_and_digest(data)
         
         # salt (16) + nonce (16) + ciphertext + tag (16)
@@ -83,36 +215,55 @@ class AESGCMCipher:
         preferred_iterations - это значение, которое было в поле 'Итерации для расшифровки'
         (по умолчанию 100000), предназначенное для быстрого теста.
         """
-        try:
-            salt = packet[:16]
-            nonce = packet[16:32]
-            ciphertext = packet[32:-16]
-            tag = packet[-16:]
-            
-            # Попытка 1: С заданным preferred_iterations (из env или по умолчанию)
-            key = self._get_encryption_key(salt, preferred_iterations)
-            
-            cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
-            plaintext = cipher.decrypt_and_verify(ciphertext, tag)
-            return plaintext
-        except ValueError:
-            # Попытка 2: С вычисленным детерминированным количеством итераций
+        salt = packet[:SALT_SIZE]
+        nonce = packet[SALT_SIZE:HEADER_SIZE]
+        ciphertext = packet[HEADER_SIZE:-TAG_SIZE]
+        tag = packet[-TAG_SIZE:]
+
+        error = None
+        # Если оба варианта совпадают, ключ выводится только один раз
+        for iterations in self.candidate_iterations(preferred_iterations):
             try:
-                iterations = calculate_iterations_from_password(
-                    self.password.decode('utf-8'),
-                    self.iterations_password.decode('utf-8')
-                )
-                
-                salt = packet[:16]
-                nonce = packet[16:32]
-                ciphertext = packet[32:-16]
-                tag = packet[-16:]
-                
                 key = self._get_encryption_key(salt, iterations)
+                cipher = crypto_backends.new_gcm(key, nonce)
+                return cipher.decrypt_and_verify(ciphertext, tag)
+            except ValueError as e:
+                error = e
+        # Ни одна попытка не удалась
+        raise ValueError("Ошибка расшифрования: повреждённые данные или неверный пароль") from error
+
+    def encrypt_stream(self, src: BinaryIO, dst: BinaryIO, iterations: Optional[int] = None,
+                       progress: Optional[ProgressCallback] = None) -> int:
+        """
+        Потоковый вариант encrypt() для файлов: формат пакета тот же, но данные
+        читаются и пишутся блоками по CHUNK_SIZE. Возвращает количество итераций.
+        """
+        salt = get_random_bytes(SALT_SIZE)
+        actual_iterations = self.resolve_iterations(iterations)
+        key = self._get_encryption_key(salt, actual_iterations)
+        total = _stream_size(src) if src.seekable() else 0
+        encrypt_stream_with_key(key, salt, src, dst, progress, total)
+        return actual_iterations
+
+    def decrypt_stream(self, src: BinaryIO, dst: BinaryIO, preferred_iterations: int,
+                       progress: Optional[ProgressCallback] = None) -> int:
+        """
+        Потоковый вариант decrypt(). src и dst должны поддерживать seek: при неудачной
+        попытке dst очищается и расшифровка повторяется со следующим числом итераций.
+        Возвращает количество итераций, с которым пакет расшифровался.
+        """
+        start = src.tell()
+        salt = src.read(SALT_SIZE)
 
-                cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
-                plaintext = cipher.decrypt_and_verify(ciphertext, tag)
-                return plaintext
+        error = None
+        for iterations in self.candidate_iterations(preferred_iterations):
+            key = self._get_encryption_key(salt, iterations)
+            src.seek(start)
+            dst.seek(0)
+            dst.truncate()
+            try:
+                decrypt_stream_with_key(key, src, dst, progress)
+                return iterations
             except ValueError as e:
-                # Ни одна попытка не удалась
-                raise ValueError("Ошибка расшифрования: повреждённые данные или неверный пароль") from e
\ No newline at end of file
+                error = e
+        raise ValueError("Ошибка расшифрования: повреждённые данные или неверный пароль") from error
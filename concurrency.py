@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import sys
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from telegram.ext import BaseUpdateProcessor
+
+# ================== Блокировки и порядок обработки обновлений ==================
+
+class KeyedLocks:
+    """
+    Набор asyncio.Lock по произвольному ключу. Блокировка создаётся при первом
+    обращении и удаляется, когда её больше никто не ждёт. Ожидающие получают
+    блокировку в порядке обращения (FIFO).
+    """
+
+    def __init__(self):
+        # key -> [lock, количество владельцев и ожидающих]
+        self._locks = {}
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable):
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    def locked(self, key: Hashable) -> bool:
+        entry = self._locks.get(key)
+        return bool(entry and entry[0].locked())
+
+
+class OrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Обрабатывает обновления параллельно (до max_concurrent_updates), но
+    обновления с одинаковым ключом порядка — строго по очереди поступления.
+    Ключ вычисляет order_key(update); None означает «без упорядочивания».
+
+    Семафор базового класса берётся до do_process_update, и обновление, ждущее
+    своей очереди по ключу, занимало бы слот. Поэтому он отключён, а слот
+    (собственный семафор) берётся только после блокировки ключа.
+    """
+
+    def __init__(self, max_concurrent_updates: int,
+                 order_key: Callable[[object], Optional[Hashable]]):
+        super().__init__(sys.maxsize)
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._order_key = order_key
+        self._locks = KeyedLocks()
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        # Application запускает задачи в порядке поступления обновлений, а семафор базового
+        # класса никогда не занят, поэтому первое переключение контекста - ожидание блокировки
+        # ключа (или слота), и обе очереди обслуживаются по порядку (FIFO)
+        key = self._order_key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+        async with self._locks.hold(key):
+            async with self._slots:
+                await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
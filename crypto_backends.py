@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+Сменные реализации PBKDF2-HMAC-SHA1 и AES-GCM.
+
+Формат пакетов от выбора реализации не зависит: каждая реализация перед
+использованием проходит самопроверку (тестовый вектор RFC 6070 для PBKDF2 и
+побайтовое сравнение с pycryptodome для AES-GCM), а при запуске
+select_fastest() выбирает самую быструю из прошедших проверку.
+
+Запуск `python crypto_backends.py` печатает результаты самопроверки и замеров и
+проверяет каждую комбинацию реализаций на эталонном пакете, созданном исходной
+версией cipher_logic.py (код выхода 1, если хоть одна не совпала побайтово).
+"""
+import hashlib
+import os
+import time
+from typing import Optional
+
+from Crypto.Cipher import AES
+from Crypto.Hash import SHA1
+from Crypto.Protocol.KDF import PBKDF2
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:
+    Cipher = None
+
+# RFC 6070, PBKDF2-HMAC-SHA1, тест 5
+KDF_TEST_VECTOR = (
+    b"passwordPASSWORDpassword", b"saltSALTsaltSALTsaltSALTsaltSALTsalt", 4096, 25,
+    bytes.fromhex("3d2eec4fe41c849b80c8d83662c0e44a8b291a964cf2f07038"),
+)
+# Эталонный пакет salt (16) + nonce (16) + ciphertext + tag (16), созданный исходным
+# AESGCMCipher.encrypt (pycryptodome) с фиксированными солью, nonce и 1000 итераций
+PACKET_TEST_VECTOR = {
+    'password': "Docker-TG-Bot known answer",
+    'iterations': 1000,
+    'salt': bytes(range(16)),
+    'nonce': bytes(range(16, 32)),
+    'plaintext': "Проверка формата пакета: salt + nonce + ciphertext + tag\n".encode('utf-8'),
+    'key': bytes.fromhex("47264a9933d5bb5898730a6dc56dbbad61da620511a2d81e56c337c023b64e5f"),
+    'packet': bytes.fromhex(
+        "000102030405060708090a0b0c0d0e0f101112131415161718191a1b1c1d1e1fdd7e4e2ddb3e216f5f79273e"
+        "14929e891010527e4949126e866a4cfb77f2bd389c4a5943230783cd4b1466850b53335bfa74a92187acd7"
+        "517047502c06d667a30a901ff25c88ba0a317057cc938b639d6e3439f89585d2e9d48fdecc68e8"
+    ),
+    # calculate_iterations_from_password(password, "iterations") в исходной версии
+    'iterations_password': "iterations",
+    'derived_iterations': 5673384,
+}
+KDF_BENCHMARK_ITERATIONS = 20000
+AEAD_BENCHMARK_SIZE = 4 * 1024 * 1024
+# Берётся лучший из нескольких замеров, чтобы случайная задержка не решила выбор
+BENCHMARK_ROUNDS = 3
+
+# ================== PBKDF2 ==================
+
+def _kdf_pycryptodome(password: bytes, salt: bytes, iterations: int, dklen: int = 32) -> bytes:
+    # HMAC-SHA1 - PRF по умолчанию у pycryptodome, которым шифровались прежние архивы
+    return PBKDF2(password, salt, dkLen=dklen, count=iterations, hmac_hash_module=SHA1)
+
+
+def _kdf_hashlib(password: bytes, salt: bytes, iterations: int, dklen: int = 32) -> bytes:
+    # OpenSSL, без удержания GIL
+    return hashlib.pbkdf2_hmac('sha1', password, salt, iterations, dklen)
+
+
+KDF_BACKENDS = {
+    'hashlib': _kdf_hashlib,
+    'pycryptodome': _kdf_pycryptodome,
+}
+
+# ================== AES-GCM ==================
+
+class _CryptographyGCM:
+    """
+    AES-GCM из библиотеки cryptography (OpenSSL) с интерфейсом объекта
+    AES.new(key, AES.MODE_GCM, nonce=...) из pycryptodome.
+    """
+
+    def __init__(self, key: bytes, nonce: bytes):
+        self.nonce = nonce
+        self._cipher = Cipher(algorithms.AES(key), modes.GCM(nonce))
+        self._context = None
+        self._aad = []
+
+    def _get_context(self, encrypting: bool):
+        if self._context is None:
+            self._context = self._cipher.encryptor() if encrypting else self._cipher.decryptor()
+            for aad in self._aad:
+                self._context.authenticate_additional_data(aad)
+        return self._context
+
+    def update(self, aad: bytes):
+        self._aad.append(aad)
+        return self
+
+    def encrypt(self, data: bytes) -> bytes:
+        return self._get_context(True).update(data)
+
+    def decrypt(self, data: bytes) -> bytes:
+        return self._get_context(False).update(data)
+
+    def digest(self) -> bytes:
+        context = self._get_context(True)
+        context.finalize()
+        return context.tag
+
+    def verify(self, tag: bytes):
+        try:
+            self._get_context(False).finalize_with_tag(tag)
+        except InvalidTag as e:
+            raise ValueError("MAC check failed") from e
+
+    def encrypt_and_digest(self, data: bytes):
+        return self.encrypt(data), self.digest()
+
+    def decrypt_and_verify(self, data: bytes, tag: bytes) -> bytes:
+        plaintext = self.decrypt(data)
+        self.verify(tag)
+        return plaintext
+
+
+def _gcm_pycryptodome(key: bytes, nonce: bytes):
+    return AES.new(key, AES.MODE_GCM, nonce=nonce)
+
+
+def _gcm_cryptography(key: bytes, nonce: bytes):
+    return _CryptographyGCM(key, nonce)
+
+
+AEAD_BACKENDS = {'pycryptodome': _gcm_pycryptodome}
+if Cipher is not None:
+    AEAD_BACKENDS['cryptography'] = _gcm_cryptography
+
+# ================== Выбор реализации ==================
+
+# До вызова select_fastest()/use(): hashlib из стандартной библиотеки и pycryptodome,
+# которым шифровались прежние архивы
+_active = {'kdf': 'hashlib', 'aead': 'pycryptodome'}
+
+
+def derive_key(password: bytes, salt: bytes, iterations: int, dklen: int = 32) -> bytes:
+    return KDF_BACKENDS[_active['kdf']](password, salt, iterations, dklen)
+
+
+def new_gcm(key: bytes, nonce: bytes):
+    """Объект AES-GCM с методами encrypt/decrypt/digest/verify/update, как у pycryptodome."""
+    return AEAD_BACKENDS[_active['aead']](key, nonce)
+
+
+def active_backends() -> dict:
+    return dict(_active)
+
+
+def use(kdf: Optional[str] = None, aead: Optional[str] = None):
+    """Явно выбирает реализации (например, в дочерних процессах)."""
+    if kdf:
+        if kdf not in KDF_BACKENDS:
+            raise ValueError(f"Неизвестная реализация PBKDF2: {kdf}")
+        _active['kdf'] = kdf
+    if aead:
+        if aead not in AEAD_BACKENDS:
+            raise ValueError(f"Неизвестная реализация AES-GCM: {aead}")
+        _active['aead'] = aead
+
+
+def _kdf_self_test(name: str) -> bool:
+    password, salt, iterations, dklen, expected = KDF_TEST_VECTOR
+    kdf = KDF_BACKENDS[name]
+    if kdf(password, salt, iterations, dklen) != expected:
+        return False
+    # Совпадение с эталоном на реальных параметрах (32 байта, 16 байт соли)
+    salt = os.urandom(16)
+    return kdf(b"test", salt, 1000) == _kdf_pycryptodome(b"test", salt, 1000)
+
+
+def _aead_self_test(name: str) -> bool:
+    key, nonce, aad = os.urandom(32), os.urandom(16), os.urandom(13)
+    data = os.urandom(70000)
+    reference = AES.new(key, AES.MODE_GCM, nonce=nonce)
+    reference.update(aad)
+    expected = reference.encrypt(data[:1000]) + reference.encrypt(data[1000:]), reference.digest()
+
+    encryptor = AEAD_BACKENDS[name](key, nonce).update(aad)
+    actual = encryptor.encrypt(data[:5]) + encryptor.encrypt(data[5:]), encryptor.digest()
+    if actual != expected:
+        return False
+
+    decryptor = AEAD_BACKENDS[name](key, nonce).update(aad)
+    if decryptor.decrypt(expected[0]) != data:
+        return False
+    decryptor.verify(expected[1])
+
+    tampered = AEAD_BACKENDS[name](key, nonce).update(aad)
+    tampered.decrypt(expected[0])
+    try:
+        tampered.verify(bytes(16))
+    except ValueError:
+        return True
+    return False
+
+
+def self_test() -> dict:
+    """Возвращает {'kdf': {имя: ok}, 'aead': {имя: ok}}."""
+    results = {'kdf': {}, 'aead': {}}
+    for name in KDF_BACKENDS:
+        try:
+            results['kdf'][name] = _kdf_self_test(name)
+        except Exception:
+            results['kdf'][name] = False
+    for name in AEAD_BACKENDS:
+        try:
+            results['aead'][name] = _aead_self_test(name)
+        except Exception:
+            results['aead'][name] = False
+    return results
+
+
+def known_answer_test() -> dict:
+    """
+    Для каждой пары (PBKDF2, AES-GCM) собирает пакет из PACKET_TEST_VECTOR, сравнивает его
+    с эталоном побайтово и расшифровывает эталон через AESGCMCipher.decrypt.
+    Возвращает {'kdf+aead': None или текст ошибки}.
+    """
+    # cipher_logic импортирует этот модуль, поэтому импорт - при вызове
+    from cipher_logic import AESGCMCipher, calculate_iterations_from_password
+
+    vector = PACKET_TEST_VECTOR
+    password = vector['password'].encode('utf-8')
+    saved = dict(_active)
+    results = {}
+    try:
+        for kdf in KDF_BACKENDS:
+            for aead in AEAD_BACKENDS:
+                use(kdf, aead)
+                error = None
+                try:
+                    key = derive_key(password, vector['salt'], vector['iterations'])
+                    ciphertext, tag = new_gcm(key, vector['nonce']).encrypt_and_digest(vector['plaintext'])
+                    packet = vector['salt'] + vector['nonce'] + ciphertext + tag
+                    if key != vector['key']:
+                        error = "ключ не совпадает с эталоном"
+                    elif packet != vector['packet']:
+                        error = "пакет не совпадает с эталоном"
+                    elif AESGCMCipher(vector['password']).decrypt(vector['packet'], vector['iterations']) != vector['plaintext']:
+                        error = "AESGCMCipher.decrypt вернул другие данные"
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                results[f"{kdf}+{aead}"] = error
+    finally:
+        _active.update(saved)
+
+    iterations = calculate_iterations_from_password(vector['password'], vector['iterations_password'])
+    results['iterations'] = None if iterations == vector['derived_iterations'] else (
+        f"calculate_iterations_from_password: {iterations} вместо {vector['derived_iterations']}"
+    )
+    return results
+
+
+def _benchmark_kdf(name: str) -> float:
+    best = None
+    for _ in range(BENCHMARK_ROUNDS):
+        started = time.perf_counter()
+        KDF_BACKENDS[name](b"benchmark", os.urandom(16), KDF_BENCHMARK_ITERATIONS)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _benchmark_aead(name: str) -> float:
+    data = bytes(AEAD_BENCHMARK_SIZE)
+    best = None
+    for _ in range(BENCHMARK_ROUNDS):
+        started = time.perf_counter()
+        cipher = AEAD_BACKENDS[name](os.urandom(32), os.urandom(16))
+        cipher.encrypt(data)
+        cipher.digest()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def select_fastest(kdf: Optional[str] = None, aead: Optional[str] = None) -> dict:
+    """
+    Самопроверка и замер всех доступных реализаций; выбирает самые быстрые из
+    прошедших проверку. kdf/aead (например, из .env) задают реализацию явно.
+    Возвращает отчёт {'kdf': ..., 'aead': ..., 'timings': {...}, 'self_test': {...}}.
+    """
+    tests = self_test()
+    timings = {'kdf': {}, 'aead': {}}
+    for name, ok in tests['kdf'].items():
+        if ok:
+            timings['kdf'][name] = _benchmark_kdf(name)
+    for name, ok in tests['aead'].items():
+        if ok:
+            timings['aead'][name] = _benchmark_aead(name)
+
+    if kdf and not tests['kdf'].get(kdf):
+        raise ValueError(f"Реализация PBKDF2 {kdf} недоступна или не прошла самопроверку")
+    if aead and not tests['aead'].get(aead):
+        raise ValueError(f"Реализация AES-GCM {aead} недоступна или не прошла самопроверку")
+    if not timings['kdf'] or not timings['aead']:
+        raise RuntimeError("Ни одна реализация не прошла самопроверку")
+
+    use(kdf or min(timings['kdf'], key=timings['kdf'].get),
+        aead or min(timings['aead'], key=timings['aead'].get))
+    report = active_backends()
+    report['timings'] = timings
+    report['self_test'] = tests
+    return report
+
+
+def format_report(report: dict) -> str:
+    kdf_times = ", ".join(f"{name} {seconds * 1000:.1f} мс" for name, seconds in report['timings']['kdf'].items())
+    aead_times = ", ".join(
+        f"{name} {AEAD_BENCHMARK_SIZE / seconds / 1e6:.0f} МБ/с" for name, seconds in report['timings']['aead'].items()
+    )
+    return (f"PBKDF2: {report['kdf']} ({kdf_times} на {KDF_BENCHMARK_ITERATIONS} итераций); "
+            f"AES-GCM: {report['aead']} ({aead_times})")
+
+
+if __name__ == "__main__":
+    result = select_fastest()
+    print("Самопроверка:", result['self_test'])
+    print("Выбрано:", format_report(result))
+    failed = 0
+    for combination, error in known_answer_test().items():
+        print(f"Эталонный пакет, {combination}: {error or 'OK'}")
+        failed += bool(error)
+    raise SystemExit(1 if failed else 0)
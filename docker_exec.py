@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import math
+import re
+import shlex
+import threading
+from typing import Optional
+
+import docker
+
+# Имя команды попадает в callback_data (не больше 64 байт вместе со ссылкой на контейнер)
+EXEC_NAME_MAX_LENGTH = 16
+EXEC_NAME_RE = re.compile(rf'^[A-Za-z0-9_-]{{1,{EXEC_NAME_MAX_LENGTH}}}$')
+
+
+def parse_exec_commands(spec: str) -> dict:
+    """
+    Разбирает EXEC_COMMANDS: "df=df -h;ps=ps aux". Разделитель - ';', потому что в самих
+    командах бывают запятые (ps -o pid,cmd). Команда разбивается как в shell (shlex),
+    но выполняется без shell. Имя - до 16 символов [A-Za-z0-9_-]. Возвращает {имя: [argv]}.
+    """
+    commands = {}
+    for item in spec.split(';'):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, command = item.partition('=')
+        name = name.strip()
+        argv = shlex.split(command) if sep else []
+        if not argv or not EXEC_NAME_RE.match(name):
+            raise ValueError(f"Неверный элемент EXEC_COMMANDS: {item!r} "
+                             f"(ожидается имя=команда, имя до 16 символов A-Z a-z 0-9 _ -)")
+        commands[name] = argv
+    return commands
+
+
+def with_kill_timeout(argv: list, seconds: float) -> list:
+    """
+    Оборачивает команду в timeout -s KILL, чтобы процесс завершал сам контейнер: exec API
+    не умеет останавливать запущенную команду. Нужна утилита timeout в образе (coreutils
+    или busybox).
+    """
+    return ["timeout", "-s", "KILL", str(max(1, math.ceil(seconds))), *argv]
+
+
+class ExecOutput:
+    """
+    Ограниченный буфер вывода команды. Пишется из потока чтения, читается из event loop.
+    Хранит не больше max_bytes; всё сверх лимита отбрасывается (truncated).
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.truncated = False
+        self.total = 0
+        self.version = 0
+        self._data = bytearray()
+        self._lock = threading.Lock()
+
+    def append(self, data: bytes) -> bool:
+        """Добавляет блок вывода. False - лимит исчерпан, чтение нужно прекратить."""
+        with self._lock:
+            self.total += len(data)
+            room = self.max_bytes - len(self._data)
+            self._data += data[:max(room, 0)]
+            if len(data) > room:
+                self.truncated = True
+            self.version += 1
+            return not self.truncated
+
+    def getvalue(self) -> bytes:
+        with self._lock:
+            return bytes(self._data)
+
+    def tail(self, chars: int) -> str:
+        """Последние chars символов (UTF-8, повреждённые последовательности заменяются)."""
+        with self._lock:
+            data = bytes(self._data[-chars * 4:])
+        return data.decode('utf-8', errors='replace')[-chars:]
+
+
+def run_exec(api: docker.APIClient, container: str, argv: list, output: ExecOutput,
+             cancel: threading.Event) -> Optional[int]:
+    """
+    Выполняет команду через exec API и по мере поступления пишет stdout и stderr в output.
+    Возвращает код выхода или None, если чтение прервано (cancel или лимит вывода).
+    Прерывается только чтение: чтобы процесс не оставался работать в контейнере,
+    передавайте argv через with_kill_timeout().
+    """
+    exec_id = api.exec_create(container, argv, stdout=True, stderr=True, tty=False)['Id']
+    stream = api.exec_start(exec_id, stream=True, demux=True)
+    try:
+        for stdout, stderr in stream:
+            for data in (stdout, stderr):
+                if data and not output.append(data):
+                    cancel.set()
+            if cancel.is_set():
+                return None
+    finally:
+        stream.close()
+    return api.exec_inspect(exec_id).get('ExitCode')
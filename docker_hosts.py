@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Optional
+
+import docker
+
+DEFAULT_HOSTS = "local=unix:///var/run/docker.sock"
+HOST_NAME_RE = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+
+def parse_hosts(spec: str) -> dict:
+    """
+    Разбирает DOCKER_HOSTS: "local=unix:///var/run/docker.sock,prod=tcp://10.0.0.5:2375".
+    Имя хоста попадает в callback_data, поэтому допускаются только [A-Za-z0-9_.-].
+    """
+    hosts = {}
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, url = item.partition('=')
+        name, url = name.strip(), url.strip()
+        if not sep or not url or not HOST_NAME_RE.match(name):
+            raise ValueError(f"Неверный элемент DOCKER_HOSTS: {item!r} (ожидается имя=адрес)")
+        if name in hosts:
+            raise ValueError(f"Хост {name} указан в DOCKER_HOSTS дважды")
+        hosts[name] = url
+    if not hosts:
+        raise ValueError("DOCKER_HOSTS не содержит ни одного хоста")
+    return hosts
+
+
+class DockerHost:
+    """
+    Один Docker-демон. У каждого хоста свой пул HTTP-соединений (max_pool_size) и свой
+    пул потоков того же размера: зависший хост занимает только свои потоки и не
+    задерживает вызовы к остальным. Клиент создаётся при первом обращении и
+    пересоздаётся, если подключиться не удалось.
+    """
+
+    def __init__(self, name: str, url: str, timeout: float, pool_size: int):
+        self.name = name
+        self.url = url
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._client = None
+        self._streaming_apis = {}
+        self._client_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix=f"docker-{name}")
+
+    def client(self) -> docker.DockerClient:
+        with self._client_lock:
+            if self._client is None:
+                # Конструктор сразу запрашивает версию API, поэтому вызывается только в потоках хоста
+                self._client = docker.DockerClient(base_url=self.url, timeout=self.timeout,
+                                                   max_pool_size=self.pool_size)
+            return self._client
+
+    def streaming_api(self, timeout: float) -> docker.APIClient:
+        """
+        Отдельный низкоуровневый клиент для долгих потоков (exec): таймаут чтения у него
+        свой, а не DOCKER_TIMEOUT, и соединения не занимают пул обычных запросов.
+        """
+        version = self.client().api.api_version
+        with self._client_lock:
+            if timeout not in self._streaming_apis:
+                self._streaming_apis[timeout] = docker.APIClient(base_url=self.url, version=version, timeout=timeout)
+            return self._streaming_apis[timeout]
+
+    def submit(self, fn: Callable, *args):
+        """fn(client, *args) в пуле потоков хоста (concurrent.futures.Future)."""
+        return self._executor.submit(lambda: fn(self.client(), *args))
+
+    async def call(self, fn: Callable, *args, timeout: Optional[float] = -1):
+        """
+        fn(client, *args) в пуле потоков хоста. timeout=-1 - DOCKER_TIMEOUT, None - без
+        ограничения (для start/stop, которые Docker SDK ограничивает сам).
+        """
+        future = asyncio.wrap_future(self.submit(fn, *args))
+        limit = self.timeout if timeout == -1 else timeout
+        try:
+            return await asyncio.wait_for(future, limit)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"хост {self.name} не ответил за {limit:g} сек") from None
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._client is not None:
+            self._client.close()
+        for api in self._streaming_apis.values():
+            api.close()
+
+
+class DockerHosts:
+    """Набор Docker-хостов из DOCKER_HOSTS с параллельным опросом всех сразу."""
+
+    def __init__(self, spec: str, timeout: float = 10, pool_size: int = 4):
+        self.hosts = {
+            name: DockerHost(name, url, timeout, pool_size) for name, url in parse_hosts(spec).items()
+        }
+
+    def __len__(self):
+        return len(self.hosts)
+
+    def __iter__(self):
+        return iter(self.hosts.values())
+
+    @property
+    def default(self) -> DockerHost:
+        return next(iter(self.hosts.values()))
+
+    def get(self, name: Optional[str]) -> DockerHost:
+        """Хост по имени; None - первый (кнопки, созданные до появления нескольких хостов)."""
+        if name is None:
+            return self.default
+        if name not in self.hosts:
+            raise KeyError(f"Неизвестный Docker-хост: {name}")
+        return self.hosts[name]
+
+    async def gather(self, fn: Callable, *args) -> tuple:
+        """
+        Выполняет fn(client, *args) на всех хостах параллельно. Каждый хост ограничен
+        своим таймаутом, поэтому медленный или недоступный хост не задерживает ответ
+        дольше DOCKER_TIMEOUT. Возвращает ({хост: результат}, {хост: ошибка}).
+        """
+        hosts = list(self.hosts.values())
+        outcomes = await asyncio.gather(*(host.call(fn, *args) for host in hosts), return_exceptions=True)
+        results, errors = {}, {}
+        for host, outcome in zip(hosts, outcomes):
+            if isinstance(outcome, Exception):
+                errors[host.name] = str(outcome) or type(outcome).__name__
+            else:
+                results[host.name] = outcome
+        return results, errors
+
+    def ping_all(self) -> dict:
+        """Синхронная проверка всех хостов при запуске: {хост: None или текст ошибки}."""
+        futures = {host.name: host.submit(lambda client: client.ping()) for host in self}
+        timeout = max(host.timeout for host in self)
+        wait(futures.values(), timeout=timeout)
+        status = {}
+        for name, future in futures.items():
+            if not future.done():
+                status[name] = f"нет ответа за {timeout:g} сек"
+            elif future.exception():
+                status[name] = str(future.exception())
+            else:
+                status[name] = None
+        return status
+
+    def close(self):
+        for host in self:
+            host.close()
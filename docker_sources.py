@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Источники бэкапа из Docker: том или путь внутри контейнера. Данные читаются через
+Engine API (get_archive, tar-поток) и сразу пишутся в шифрующий поток, без
+монтирования в бота и без промежуточных копий на диске.
+
+    volume:[хост/]том[!pause|!stop]
+    container:[хост/]контейнер:/путь[!pause|!stop]
+
+!pause / !stop приостанавливают (останавливают) контейнер - или, для тома, все
+запущенные контейнеры, которые его используют - только на время чтения потока.
+"""
+import re
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import docker
+
+DEFAULT_HELPER_IMAGE = "alpine:3"
+STREAM_CHUNK_SIZE = 1024 * 1024
+HELPER_LABEL = "docker-tg-bot.backup-helper"
+
+_SOURCE_RE = re.compile(
+    r'^(?P<kind>volume|container):'
+    r'(?:(?P<host>[A-Za-z0-9_.-]+)/)?(?P<target>[A-Za-z0-9][A-Za-z0-9_.-]*)'
+    r'(?::(?P<path>/[^!]*))?'
+    r'(?:!(?P<mode>pause|stop))?$'
+)
+
+
+def parse_source(spec: str) -> Optional[dict]:
+    """Разбирает источник вида volume:/container:. None - обычная папка."""
+    if not spec.startswith(("volume:", "container:")):
+        return None
+    match = _SOURCE_RE.match(spec)
+    if not match or (match['kind'] == "container") != bool(match['path']):
+        raise ValueError(
+            f"Неверный источник {spec!r}: ожидается volume:[хост/]том[!pause|!stop] "
+            f"или container:[хост/]контейнер:/путь[!pause|!stop]"
+        )
+    return match.groupdict()
+
+
+def _copy(stream, dst) -> int:
+    size = 0
+    for chunk in stream:
+        dst.write(chunk)
+        size += len(chunk)
+    return size
+
+
+@contextmanager
+def consistent_snapshot(containers: list, mode: Optional[str]):
+    """
+    Приостанавливает (mode='pause') или останавливает (mode='stop') запущенные контейнеры
+    на время блока и возобновляет их в finally. Простой записывается в snapshot['downtime'].
+    """
+    snapshot = {'downtime': 0.0, 'containers': []}
+    changed = []
+    started = time.perf_counter()
+    try:
+        if mode:
+            for container in containers:
+                container.reload()
+                if container.status != 'running':
+                    continue
+                container.pause() if mode == 'pause' else container.stop()
+                changed.append(container)
+        yield snapshot
+    finally:
+        for container in reversed(changed):
+            try:
+                container.unpause() if mode == 'pause' else container.start()
+            except docker.errors.APIError as e:
+                print(f"Не удалось возобновить контейнер {container.name}: {e}")
+        if changed:
+            snapshot['downtime'] = time.perf_counter() - started
+            snapshot['containers'] = [container.name for container in changed]
+
+
+def stream_container_path(client: docker.DockerClient, name: str, path: str, dst,
+                          mode: Optional[str] = None) -> dict:
+    """Пишет tar-поток пути внутри контейнера в dst. Возвращает {'bytes', 'downtime', 'containers'}."""
+    container = client.containers.get(name)
+    with consistent_snapshot([container], mode) as snapshot:
+        stream, _ = container.get_archive(path, chunk_size=STREAM_CHUNK_SIZE)
+        size = _copy(stream, dst)
+    return dict(snapshot, bytes=size)
+
+
+def stream_volume(client: docker.DockerClient, volume: str, dst, mode: Optional[str] = None,
+                  helper_image: str = DEFAULT_HELPER_IMAGE) -> dict:
+    """
+    Пишет tar-поток тома в dst. Том монтируется (только чтение) во вспомогательный
+    контейнер, который создаётся, но не запускается, и удаляется после чтения.
+    """
+    client.volumes.get(volume)
+    users = client.containers.list(filters={'volume': volume}) if mode else []
+    create_args = dict(
+        command=["true"], network_disabled=True, labels={HELPER_LABEL: volume},
+        volumes={volume: {'bind': f"/backup/{volume}", 'mode': 'ro'}},
+    )
+    try:
+        helper = client.containers.create(helper_image, **create_args)
+    except docker.errors.ImageNotFound:
+        client.images.pull(helper_image)
+        helper = client.containers.create(helper_image, **create_args)
+
+    try:
+        with consistent_snapshot(users, mode) as snapshot:
+            stream, _ = helper.get_archive(f"/backup/{volume}", chunk_size=STREAM_CHUNK_SIZE)
+            size = _copy(stream, dst)
+    finally:
+        helper.remove(force=True)
+    return dict(snapshot, bytes=size)
+
+
+def stream_source(client: docker.DockerClient, source: dict, dst,
+                  helper_image: str = DEFAULT_HELPER_IMAGE) -> dict:
+    """Источник из parse_source() -> tar-поток в dst."""
+    if source['kind'] == "volume":
+        return stream_volume(client, source['target'], dst, source['mode'], helper_image)
+    return stream_container_path(client, source['target'], source['path'], dst, source['mode'])
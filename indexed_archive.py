@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+"""
+Зашифрованный архив с произвольным доступом (*.dtga).
+
+В отличие от .zip.enc (один тег GCM на весь архив), каждый файл разбит на
+сегменты, и каждый сегмент зашифрован отдельно. Зашифрованный индекс в конце
+файла хранит для каждого пути смещения его сегментов. Поэтому для просмотра
+содержимого читается только индекс, а для восстановления одного файла или
+папки - только его сегменты (через seek), независимо от размера архива.
+
+Формат:
+    заголовок   MAGIC (8) + salt (16) + iterations (4, big-endian)
+    сегменты    ciphertext + tag (16); nonce = 0x00000000 + номер сегмента (8)
+    индекс      ciphertext + tag (16); nonce = 0x00000001 + 0 (8); zlib(JSON)
+    хвост       смещение индекса (8) + длина индекса (8) + MAGIC (8)
+Заголовок входит в AAD каждого сегмента и индекса, номер сегмента - в AAD сегмента,
+так что сегменты нельзя переставить или перенести из другого архива.
+
+Примеры:
+    python indexed_archive.py create /app/data_to_archive backup.dtga
+    python indexed_archive.py list backup.dtga
+    python indexed_archive.py verify backup.dtga
+    python indexed_archive.py extract backup.dtga restored/ data_to_archive/nginx/nginx.conf
+"""
+import argparse
+import getpass
+import json
+import os
+import shutil
+import struct
+import sys
+import time
+import zlib
+from typing import Iterator, Optional
+
+import crypto_backends
+from cipher_logic import AESGCMCipher, SALT_SIZE, TAG_SIZE, derive_key
+from restore import safe_join
+
+MAGIC = b"DTGIDX01"
+ARCHIVE_SUFFIX = ".dtga"
+SEGMENT_SIZE = 1024 * 1024
+COMPRESS_LEVEL = 6
+
+_HEADER = struct.Struct('>8s16sI')
+_TRAILER = struct.Struct('>QQ8s')
+_SEGMENT_NONCE_PREFIX = b'\x00\x00\x00\x00'
+_INDEX_NONCE = b'\x00\x00\x00\x01' + bytes(8)
+
+
+def _segment_nonce(number: int) -> bytes:
+    return _SEGMENT_NONCE_PREFIX + struct.pack('>Q', number)
+
+# ================== Запись ==================
+
+def write_archive(folder_path: str, output_file: str, password: bytes, iterations: int,
+                  segment_size: int = SEGMENT_SIZE, salt: Optional[bytes] = None,
+                  key: Optional[bytes] = None) -> dict:
+    """
+    Архивирует папку в формат с индексом. Пути внутри архива начинаются с имени
+    папки (как у shutil.make_archive). salt и key - заранее выведенный ключ
+    (см. key_pool.py), иначе он выводится здесь. Возвращает статистику записи.
+    """
+    started = time.perf_counter()
+    if key is None:
+        salt = os.urandom(SALT_SIZE)
+        key = derive_key(password, salt, iterations)
+    header = _HEADER.pack(MAGIC, salt, iterations)
+    kdf_seconds = time.perf_counter() - started
+
+    folder_path = os.path.abspath(folder_path)
+    entries = []
+    segment_number = 0
+    plain_bytes = 0
+
+    with open(output_file, 'wb') as out:
+        out.write(header)
+        offset = len(header)
+
+        for dirpath, dirnames, filenames in os.walk(folder_path):
+            dirnames.sort()
+            relative_dir = os.path.relpath(dirpath, os.path.dirname(folder_path)).replace(os.sep, '/')
+            stat = os.stat(dirpath)
+            entries.append({'p': relative_dir + '/', 't': 'd', 'm': stat.st_mode & 0o7777, 'mt': int(stat.st_mtime)})
+
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                # Как в zip-бэкапе: только обычные файлы (и ссылки на них). FIFO заблокировал
+                # бы чтение навсегда, а битая ссылка прервала бы весь архив
+                if not os.path.isfile(path):
+                    continue
+                stat = os.stat(path)
+                entry = {
+                    'p': f"{relative_dir}/{filename}", 't': 'f', 's': 0,
+                    'm': stat.st_mode & 0o7777, 'mt': int(stat.st_mtime),
+                    'o': offset, 'n': segment_number, 'seg': [],
+                }
+                with open(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(segment_size), b''):
+                        compressed = zlib.compress(chunk, COMPRESS_LEVEL)
+                        # Несжимаемые данные храним как есть
+                        is_compressed = len(compressed) < len(chunk)
+                        payload = compressed if is_compressed else chunk
+
+                        cipher = crypto_backends.new_gcm(key, _segment_nonce(segment_number))
+                        cipher.update(header + struct.pack('>Q', segment_number))
+                        ciphertext, tag = cipher.encrypt_and_digest(payload)
+                        out.write(ciphertext)
+                        out.write(tag)
+
+                        stored = len(ciphertext) + TAG_SIZE
+                        entry['seg'].append([stored, int(is_compressed)])
+                        entry['s'] += len(chunk)
+                        offset += stored
+                        segment_number += 1
+                plain_bytes += entry['s']
+                entries.append(entry)
+
+        index_plain = zlib.compress(json.dumps(entries, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        cipher = crypto_backends.new_gcm(key, _INDEX_NONCE)
+        cipher.update(header + b'index')
+        ciphertext, tag = cipher.encrypt_and_digest(index_plain)
+        out.write(ciphertext)
+        out.write(tag)
+        out.write(_TRAILER.pack(offset, len(ciphertext) + TAG_SIZE, MAGIC))
+
+    return {
+        'files': sum(1 for entry in entries if entry['t'] == 'f'),
+        'bytes': plain_bytes,
+        'archive_bytes': os.path.getsize(output_file),
+        'segments': segment_number,
+        'kdf_seconds': kdf_seconds,
+        'seconds': time.perf_counter() - started,
+        'iterations': iterations,
+    }
+
+# ================== Чтение ==================
+
+class IndexedArchive:
+    """
+    Чтение архива с произвольным доступом. При открытии читаются только заголовок,
+    хвост и индекс; содержимое файлов - по запросу, посегментно через seek.
+    """
+
+    def __init__(self, path: str, password: bytes):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._header = self._file.read(_HEADER.size)
+            if len(self._header) != _HEADER.size:
+                raise ValueError("Файл слишком короткий для архива")
+            magic, salt, self.iterations = _HEADER.unpack(self._header)
+            if magic != MAGIC:
+                raise ValueError("Это не архив с индексом (неверная сигнатура)")
+
+            size = self._file.seek(0, os.SEEK_END)
+            self._file.seek(size - _TRAILER.size)
+            index_offset, index_length, trailer_magic = _TRAILER.unpack(self._file.read(_TRAILER.size))
+            if trailer_magic != MAGIC or index_offset + index_length + _TRAILER.size != size:
+                raise ValueError("Архив обрезан или повреждён (нет индекса)")
+
+            self._key = derive_key(password, salt, self.iterations)
+            self._file.seek(index_offset)
+            stored = self._file.read(index_length)
+            cipher = crypto_backends.new_gcm(self._key, _INDEX_NONCE)
+            cipher.update(self._header + b'index')
+            try:
+                index_plain = cipher.decrypt_and_verify(stored[:-TAG_SIZE], stored[-TAG_SIZE:])
+            except ValueError as e:
+                raise ValueError("Ошибка расшифрования индекса: повреждённые данные или неверный пароль") from e
+            self.entries = json.loads(zlib.decompress(index_plain).decode('utf-8'))
+        except Exception:
+            self._file.close()
+            raise
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def select(self, members: Optional[list] = None) -> list:
+        """Записи по точным путям или префиксам папок; без members - все."""
+        if not members:
+            return list(self.entries)
+        prefixes = [member.strip('/') for member in members]
+        return [
+            entry for entry in self.entries
+            if any(entry['p'].rstrip('/') == prefix or entry['p'].startswith(prefix + '/') for prefix in prefixes)
+        ]
+
+    def read_file(self, entry: dict) -> Iterator[bytes]:
+        """Расшифровывает сегменты одного файла; каждый сегмент проверяется своим тегом."""
+        self._file.seek(entry['o'])
+        for i, (stored, is_compressed) in enumerate(entry['seg']):
+            number = entry['n'] + i
+            data = self._file.read(stored)
+            if len(data) != stored:
+                raise ValueError(f"{entry['p']}: архив обрезан")
+            cipher = crypto_backends.new_gcm(self._key, _segment_nonce(number))
+            cipher.update(self._header + struct.pack('>Q', number))
+            try:
+                payload = cipher.decrypt_and_verify(data[:-TAG_SIZE], data[-TAG_SIZE:])
+            except ValueError as e:
+                raise ValueError(f"{entry['p']}: повреждён сегмент {i}") from e
+            yield zlib.decompress(payload) if is_compressed else payload
+
+    def verify(self, members: Optional[list] = None) -> list:
+        """Проверяет теги всех сегментов выбранных файлов без записи на диск. Результат - как у extract."""
+        results = []
+        for entry in self.select(members):
+            if entry['t'] == 'd':
+                continue
+            started = time.perf_counter()
+            result = {'name': entry['p'], 'size': entry['s'], 'ok': False, 'error': ''}
+            try:
+                size = sum(len(data) for data in self.read_file(entry))
+                if size == entry['s']:
+                    result['ok'] = True
+                else:
+                    result['error'] = "размер не совпадает"
+            except (ValueError, zlib.error) as e:
+                result['error'] = str(e)
+            result['seconds'] = time.perf_counter() - started
+            results.append(result)
+        return results
+
+    def extract(self, destination: str, members: Optional[list] = None) -> list:
+        """Восстанавливает выбранные файлы/папки в destination. Возвращает результат по каждому файлу."""
+        results = []
+        for entry in self.select(members):
+            target = safe_join(destination, entry['p'])
+            if entry['t'] == 'd':
+                os.makedirs(target, exist_ok=True)
+                continue
+            started = time.perf_counter()
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            result = {'name': entry['p'], 'size': entry['s'], 'ok': False, 'error': ''}
+            temp_path = target + ".part"
+            try:
+                with open(temp_path, 'wb') as out:
+                    for data in self.read_file(entry):
+                        out.write(data)
+                os.replace(temp_path, target)
+                os.chmod(target, entry['m'])
+                os.utime(target, (entry['mt'], entry['mt']))
+                result['ok'] = True
+            except (ValueError, zlib.error) as e:
+                result['error'] = str(e)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            result['seconds'] = time.perf_counter() - started
+            results.append(result)
+        return results
+
+def verify_or_restore_archive(path: str, password: bytes, extract_to: Optional[str] = None) -> dict:
+    """
+    Проверка (или восстановление в extract_to) всего архива с отчётом в формате
+    restore.verify_or_restore. Файлы распаковываются в extract_to + '.partial', папка
+    переименовывается в extract_to только если все файлы прошли проверку.
+    """
+    started = time.perf_counter()
+    staging = extract_to + ".partial" if extract_to else None
+    report = {'entries': [], 'ok': False, 'error': '', 'bytes': 0, 'seconds': 0.0}
+    try:
+        with IndexedArchive(path, password) as archive:
+            report['entries'] = archive.extract(staging) if staging else archive.verify()
+        report['ok'] = all(entry['ok'] for entry in report['entries'])
+        if not report['ok']:
+            report['error'] = "Есть записи с ошибками"
+        elif staging:
+            os.replace(staging, extract_to)
+    except (OSError, ValueError) as e:
+        report['error'] = str(e) or "Ошибка проверки"
+    finally:
+        if staging and os.path.isdir(staging):
+            shutil.rmtree(staging, ignore_errors=True)
+        report['bytes'] = os.path.getsize(path) if os.path.exists(path) else 0
+        report['seconds'] = time.perf_counter() - started
+    return report
+
+# ================== CLI ==================
+
+def _password() -> tuple:
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+    password = os.getenv("ENCRYPTION_PASSWORD") or getpass.getpass("Пароль шифрования: ")
+    return password, os.getenv("ITERATIONS_PASSWORD", "")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Зашифрованный архив с индексом и произвольным доступом")
+    sub = parser.add_subparsers(dest="command", required=True)
+    create = sub.add_parser("create", help="создать архив из папки")
+    create.add_argument("folder")
+    create.add_argument("archive")
+    listing = sub.add_parser("list", help="показать содержимое")
+    listing.add_argument("archive")
+    verify = sub.add_parser("verify", help="проверить теги всех сегментов без записи на диск")
+    verify.add_argument("archive")
+    extract = sub.add_parser("extract", help="восстановить файлы или папки")
+    extract.add_argument("archive")
+    extract.add_argument("destination")
+    extract.add_argument("members", nargs="*", help="пути файлов или папок внутри архива (по умолчанию все)")
+    args = parser.parse_args(argv)
+
+    password, iterations_password = _password()
+    started = time.perf_counter()
+    try:
+        if args.command == "create":
+            iterations = AESGCMCipher(password, iterations_password).resolve_iterations()
+            stats = write_archive(args.folder, args.archive, password.encode('utf-8'), iterations)
+            print(json.dumps(stats, ensure_ascii=False, indent=2))
+            return 0
+
+        with IndexedArchive(args.archive, password.encode('utf-8')) as archive:
+            if args.command == "list":
+                for entry in archive.entries:
+                    print(f"{entry.get('s', 0):>14}  {entry['p']}")
+                print(f"Записей: {len(archive.entries)}, {time.perf_counter() - started:.2f} сек", file=sys.stderr)
+                return 0
+            if args.command == "verify":
+                results = archive.verify()
+            else:
+                results = archive.extract(args.destination, args.members)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+
+    failed = [result for result in results if not result['ok']]
+    for result in failed:
+        print(f"❌ {result['name']}: {result['error']}", file=sys.stderr)
+    print(f"{'Проверено' if args.command == 'verify' else 'Восстановлено'} файлов: "
+          f"{len(results) - len(failed)}/{len(results)}, "
+          f"{time.perf_counter() - started:.2f} сек", file=sys.stderr)
+    return 0 if not failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
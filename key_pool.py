@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator
+
+from cipher_logic import AESGCMCipher, SALT_SIZE, derive_key
+
+# ================== Заранее выведенные ключи шифрования ==================
+
+class PreparedKey:
+    """Соль, итерации и выведенный из них ключ. Ключ хранится в bytearray, чтобы его можно было затереть."""
+
+    def __init__(self, salt: bytes, iterations: int, key: bytes, derive_seconds: float):
+        self.salt = salt
+        self.iterations = iterations
+        self.key = bytearray(key)
+        self.derive_seconds = derive_seconds
+
+    def wipe(self):
+        self.key[:] = bytes(len(self.key))
+
+
+class KeyPool:
+    """
+    Держит несколько готовых ключей (новая случайная соль + PBKDF2) для следующих бэкапов.
+    Ключи выводятся в фоновом потоке с пониженным приоритетом, каждый ключ выдаётся ровно
+    один раз и затирается после использования, после чего пул пополняется.
+    При size=0 фоновый поток не запускается и ключ выводится при каждом запросе.
+
+    Затирание - по возможности: копии ключа внутри PBKDF2 и AES-GCM (и неизменяемый
+    bytes, возвращённый PBKDF2) Python не позволяет очистить.
+    """
+
+    def __init__(self, cipher: AESGCMCipher, size: int = 2):
+        self._cipher = cipher
+        self.size = size
+        self._ready = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.miss_seconds = 0.0
+        if size > 0:
+            threading.Thread(target=self._fill, name="key-pool", daemon=True).start()
+
+    def _derive(self) -> PreparedKey:
+        salt = os.urandom(SALT_SIZE)
+        # Итерации выбираются так же, как в encrypt(): из паролей или случайно
+        iterations = self._cipher.resolve_iterations()
+        started = time.perf_counter()
+        key = derive_key(self._cipher.password, salt, iterations)
+        return PreparedKey(salt, iterations, key, time.perf_counter() - started)
+
+    def _fill(self):
+        try:
+            # Только этот поток (Linux): PBKDF2 не отнимает CPU у бэкапов и обработки обновлений
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            with self._condition:
+                while not self._closed and len(self._ready) >= self.size:
+                    self._condition.wait()
+                if self._closed:
+                    return
+            prepared = self._derive()
+            with self._condition:
+                if self._closed:
+                    prepared.wipe()
+                    return
+                self._ready.append(prepared)
+
+    @contextmanager
+    def acquire(self) -> Iterator[PreparedKey]:
+        """
+        Выдаёт готовый ключ или, если пул пуст, выводит его сразу (в вызывающем потоке).
+        После выхода из блока ключ затирается.
+        """
+        with self._condition:
+            prepared = self._ready.popleft() if self._ready else None
+            if prepared:
+                self.hits += 1
+                self.saved_seconds += prepared.derive_seconds
+                self._condition.notify()
+        if prepared is None:
+            prepared = self._derive()
+            with self._condition:
+                self.misses += 1
+                self.miss_seconds += prepared.derive_seconds
+        try:
+            yield prepared
+        finally:
+            prepared.wipe()
+
+    def format_summary(self) -> str:
+        with self._condition:
+            ready = len(self._ready)
+        return (f"готово {ready}/{self.size}, из пула {self.hits} (сэкономлено {self.saved_seconds:.1f} сек), "
+                f"выведено при бэкапе {self.misses} ({self.miss_seconds:.1f} сек)")
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            while self._ready:
+                self._ready.popleft().wipe()
+            self._condition.notify_all()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+from collections import deque
+from typing import Optional
+
+from telegram import Update
+
+# ================== Метрики задержки обработки обновлений ==================
+
+# Время отправки обновления, которое может добавить заглушка Bot API (unix time, секунды)
+SOURCE_TIMESTAMP_FIELD = "sent_at"
+
+
+def source_timestamp(update: Update) -> Optional[float]:
+    """
+    Момент появления обновления у источника (unix time): поле sent_at от заглушки
+    Bot API (BOT_API_URL), иначе дата сообщения или его редактирования. Дата сообщения
+    от Telegram - с точностью до секунды; у нажатий на кнопки её нет (message.date
+    у них - время исходного сообщения), поэтому они не учитываются.
+    """
+    sent_at = update.api_kwargs.get(SOURCE_TIMESTAMP_FIELD)
+    if isinstance(sent_at, (int, float)):
+        return float(sent_at)
+    message = update.message or update.edited_message or update.channel_post or update.edited_channel_post
+    if message is None:
+        return None
+    date = message.edit_date or message.date
+    return date.timestamp() if date else None
+
+
+class LatencyWindow:
+    """Скользящее окно последних измерений задержки (мс)."""
+
+    def __init__(self, window: int = 1000):
+        self._samples = deque(maxlen=window)
+        self.total = 0
+
+    def add(self, latency_ms: float):
+        self._samples.append(latency_ms)
+        self.total += 1
+
+    def summary(self) -> dict:
+        """Возвращает count/avg/p50/p95/max по текущему окну (в мс)."""
+        if not self._samples:
+            return {'count': 0, 'total': self.total}
+        ordered = sorted(self._samples)
+        count = len(ordered)
+        return {
+            'count': count,
+            'total': self.total,
+            'avg': sum(ordered) / count,
+            'p50': ordered[int(count * 0.50)],
+            'p95': ordered[min(count - 1, int(count * 0.95))],
+            'max': ordered[-1],
+        }
+
+    def format_summary(self) -> str:
+        s = self.summary()
+        if not s['count']:
+            return "нет данных"
+        return (f"n={s['count']} (всего {s['total']}), avg={s['avg']:.2f} мс, "
+                f"p50={s['p50']:.2f} мс, p95={s['p95']:.2f} мс, max={s['max']:.2f} мс")
+
+
+class LatencyTracker:
+    """
+    Считает две задержки до старта обработки обновления:
+    queue - от поступления в очередь приложения (только работа самого бота);
+    source - от появления у источника (см. source_timestamp), включая long polling
+    и доставку, то есть именно то, что убирает webhook.
+    """
+
+    def __init__(self, window: int = 1000):
+        self._arrivals = {}
+        self.queue = LatencyWindow(window)
+        self.source = LatencyWindow(window)
+
+    def mark_arrival(self, update_id: int):
+        self._arrivals[update_id] = time.perf_counter()
+        # Защита от утечки, если обновление так и не дошло до обработчика
+        if len(self._arrivals) > 10000:
+            self._arrivals.pop(next(iter(self._arrivals)))
+
+    def mark_start(self, update: Update) -> Optional[float]:
+        """Фиксирует старт обработки. Возвращает задержку от очереди в мс или None."""
+        sent_at = source_timestamp(update)
+        if sent_at is not None:
+            self.source.add((time.time() - sent_at) * 1000)
+        arrived = self._arrivals.pop(update.update_id, None)
+        if arrived is None:
+            return None
+        latency_ms = (time.perf_counter() - arrived) * 1000
+        self.queue.add(latency_ms)
+        return latency_ms
+
+    def format_summary(self) -> str:
+        return (f"очередь→обработчик: {self.queue.format_summary()}; "
+                f"источник→обработчик: {self.source.format_summary()}")
+
+
+class TimestampedUpdateQueue(asyncio.Queue):
+    """
+    Очередь обновлений приложения, отмечающая момент поступления каждого Update.
+    И polling, и webhook кладут обновления в эту очередь, поэтому задержка
+    измеряется одинаково в обоих режимах.
+    """
+
+    def __init__(self, tracker: LatencyTracker, maxsize: int = 0):
+        super().__init__(maxsize)
+        self.tracker = tracker
+
+    def put_nowait(self, item):
+        # asyncio.Queue.put() в итоге тоже вызывает put_nowait()
+        if isinstance(item, Update):
+            self.tracker.mark_arrival(item.update_id)
+        super().put_nowait(item)
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import struct
+import tarfile
+import time
+import zlib
+from typing import Callable, Iterable, Iterator, Optional
+
+import crypto_backends
+from cipher_logic import SALT_SIZE, NONCE_SIZE, TAG_SIZE, CHUNK_SIZE
+
+# ================== Потоковая расшифровка ==================
+
+class DecryptingReader:
+    """
+    Потоковая расшифровка пакета salt + nonce + ciphertext + tag, приходящего
+    блоками (например, из HTTP-загрузки). Последние TAG_SIZE байт всегда
+    удерживаются, пока не станет ясно, что это тег. Тег проверяется при
+    достижении конца потока (read() или finish()) — до этого момента
+    расшифрованные данные не аутентифицированы.
+    """
+
+    def __init__(self, chunks: Iterable[bytes], key_for_salt: Callable[[bytes], bytes]):
+        self._chunks = iter(chunks)
+        self._key_for_salt = key_for_salt
+        self._cipher = None
+        self._tail = b''
+        self._plain = bytearray()
+        self._eof = False
+        self.ciphertext_bytes = 0
+
+    def _pull(self) -> bool:
+        """Подтягивает следующий блок. False - поток закончился (тег проверен)."""
+        if self._eof:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._eof = True
+            if self._cipher is None or len(self._tail) != TAG_SIZE:
+                raise ValueError("Поток оборвался: неполный зашифрованный пакет")
+            try:
+                self._cipher.verify(self._tail)
+            except ValueError as e:
+                raise ValueError("Ошибка расшифрования: повреждённые данные или неверный пароль") from e
+            return False
+
+        data = self._tail + chunk
+        if self._cipher is None:
+            if len(data) < SALT_SIZE + NONCE_SIZE:
+                self._tail = data
+                return True
+            salt = data[:SALT_SIZE]
+            nonce = data[SALT_SIZE:SALT_SIZE + NONCE_SIZE]
+            self._cipher = crypto_backends.new_gcm(self._key_for_salt(salt), nonce)
+            data = data[SALT_SIZE + NONCE_SIZE:]
+
+        if len(data) > TAG_SIZE:
+            ready, self._tail = data[:-TAG_SIZE], data[-TAG_SIZE:]
+            self.ciphertext_bytes += len(ready)
+            self._plain += self._cipher.decrypt(ready)
+        else:
+            self._tail = data
+        return True
+
+    def read(self, size: int) -> bytes:
+        """Возвращает до size байт открытого текста; b'' - конец потока."""
+        while len(self._plain) < size and self._pull():
+            pass
+        data = bytes(self._plain[:size])
+        del self._plain[:size]
+        return data
+
+    def finish(self):
+        """Дочитывает поток до конца и проверяет тег (остаток данных отбрасывается)."""
+        while self._pull():
+            self._plain.clear()
+        self._plain.clear()
+
+
+class _PushbackReader:
+    """Обёртка с возвратом лишних байт (нужно для deflate-потоков неизвестной длины)."""
+
+    def __init__(self, reader):
+        self._reader = reader
+        self._back = b''
+
+    def read(self, size: int) -> bytes:
+        if self._back:
+            data, self._back = self._back[:size], self._back[size:]
+            return data
+        return self._reader.read(size)
+
+    def read_exact(self, size: int) -> bytes:
+        data = b''
+        while len(data) < size:
+            chunk = self.read(size - len(data))
+            if not chunk:
+                raise ValueError("Неожиданный конец архива")
+            data += chunk
+        return data
+
+    def unread(self, data: bytes):
+        self._back = data + self._back
+
+# ================== Потоковая проверка/распаковка zip ==================
+
+LOCAL_HEADER = b'PK\x03\x04'
+CENTRAL_HEADER = b'PK\x01\x02'
+END_OF_CENTRAL_DIR = b'PK\x05\x06'
+DATA_DESCRIPTOR = b'PK\x07\x08'
+ZIP64_EXTRA_ID = 0x0001
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_ENCRYPTED = 0x01
+METHOD_STORED = 0
+METHOD_DEFLATED = 8
+
+_LOCAL_HEADER_STRUCT = struct.Struct('<HHHHHIIIHH')
+
+
+def safe_join(root: str, name: str) -> str:
+    """Путь внутри root; абсолютные пути и '..' запрещены."""
+    root = os.path.abspath(root)
+    target = os.path.normpath(os.path.join(root, name))
+    if os.path.isabs(name) or not (target == root or target.startswith(root + os.sep)):
+        raise ValueError(f"Недопустимый путь в архиве: {name}")
+    return target
+
+
+def _zip64_sizes(extra: bytes, csize: int, usize: int):
+    """Реальные размеры из zip64 extra-поля (если в заголовке стоят 0xFFFFFFFF)."""
+    position = 0
+    while position + 4 <= len(extra):
+        header_id, length = struct.unpack('<HH', extra[position:position + 4])
+        body = extra[position + 4:position + 4 + length]
+        if header_id == ZIP64_EXTRA_ID:
+            values = list(struct.unpack('<%dQ' % (len(body) // 8), body[:len(body) // 8 * 8]))
+            if usize == 0xFFFFFFFF and values:
+                usize = values.pop(0)
+            if csize == 0xFFFFFFFF and values:
+                csize = values.pop(0)
+            return csize, usize, True
+        position += 4 + length
+    return csize, usize, False
+
+
+def iter_zip_stream(reader, extract_to: Optional[str] = None) -> Iterator[dict]:
+    """
+    Последовательно читает zip из потока (без seek и без центрального каталога):
+    распаковывает каждую запись в памяти блоками, сверяет CRC32 и размер и,
+    если задан extract_to, пишет файл на диск. Отдаёт результат по каждой записи.
+    """
+    stream = _PushbackReader(reader)
+    while True:
+        signature = stream.read_exact(4)
+        if signature in (CENTRAL_HEADER, END_OF_CENTRAL_DIR):
+            return
+        if signature != LOCAL_HEADER:
+            raise ValueError("Повреждённый zip: неожиданная сигнатура")
+
+        (_, flags, method, _, _, crc, csize, usize,
+         name_len, extra_len) = _LOCAL_HEADER_STRUCT.unpack(stream.read_exact(_LOCAL_HEADER_STRUCT.size))
+        raw_name = stream.read_exact(name_len)
+        name = raw_name.decode('utf-8' if flags & 0x800 else 'cp437')
+        extra = stream.read_exact(extra_len)
+        csize, usize, zip64 = _zip64_sizes(extra, csize, usize)
+        has_descriptor = bool(flags & FLAG_DATA_DESCRIPTOR)
+
+        started = time.perf_counter()
+        entry = {'name': name, 'size': 0, 'ok': False, 'error': '', 'seconds': 0.0}
+        if flags & FLAG_ENCRYPTED:
+            raise ValueError(f"{name}: зашифрованные записи zip не поддерживаются")
+        if method not in (METHOD_STORED, METHOD_DEFLATED):
+            raise ValueError(f"{name}: неподдерживаемый метод сжатия {method}")
+        if method == METHOD_STORED and has_descriptor and not csize:
+            raise ValueError(f"{name}: stored-запись с неизвестным размером")
+
+        target = safe_join(extract_to, name) if extract_to else None
+        out = None
+        if target and name.endswith('/'):
+            os.makedirs(target, exist_ok=True)
+        elif target:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            out = open(target, 'wb')
+
+        try:
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS) if method == METHOD_DEFLATED else None
+            actual_crc = 0
+            size = 0
+            remaining = csize if not has_descriptor or csize else None
+            while remaining is None or remaining > 0:
+                chunk = stream.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise ValueError(f"{name}: неожиданный конец архива")
+                if remaining is not None:
+                    remaining -= len(chunk)
+                # max_length ограничивает память даже при очень высокой степени сжатия
+                data = decompressor.decompress(chunk, CHUNK_SIZE) if decompressor else chunk
+                while True:
+                    actual_crc = zlib.crc32(data, actual_crc)
+                    size += len(data)
+                    if out:
+                        out.write(data)
+                    if not decompressor or decompressor.eof or not decompressor.unconsumed_tail:
+                        break
+                    data = decompressor.decompress(decompressor.unconsumed_tail, CHUNK_SIZE)
+                if decompressor and decompressor.eof:
+                    # Конец deflate-потока: лишние байты принадлежат следующей структуре
+                    if decompressor.unused_data:
+                        stream.unread(decompressor.unused_data)
+                    remaining = 0
+            if decompressor and not decompressor.eof:
+                raise ValueError(f"{name}: оборванный deflate-поток")
+
+            if has_descriptor:
+                head = stream.read_exact(4)
+                if head == DATA_DESCRIPTOR:
+                    head = stream.read_exact(4)
+                crc = struct.unpack('<I', head)[0]
+                size_format = '<QQ' if zip64 else '<II'
+                csize, usize = struct.unpack(size_format, stream.read_exact(struct.calcsize(size_format)))
+        finally:
+            if out:
+                out.close()
+
+        entry['size'] = size
+        entry['seconds'] = time.perf_counter() - started
+        if actual_crc != crc:
+            entry['error'] = "CRC не совпадает"
+        elif size != usize:
+            entry['error'] = "размер не совпадает"
+        else:
+            entry['ok'] = True
+        yield entry
+
+# ================== Потоковая проверка/распаковка tar ==================
+
+def iter_tar_stream(reader, extract_to: Optional[str] = None) -> Iterator[dict]:
+    """
+    Последовательно читает tar (бэкапы томов и контейнеров из Docker get_archive).
+    Контрольных сумм данных в tar нет - целостность подтверждает тег GCM всего пакета.
+    Символические ссылки и специальные файлы учитываются, но не восстанавливаются.
+    """
+    try:
+        archive = tarfile.open(fileobj=reader, mode='r|*')
+        for member in archive:
+            started = time.perf_counter()
+            entry = {'name': member.name, 'size': 0, 'ok': True, 'error': '', 'seconds': 0.0}
+            target = safe_join(extract_to, member.name) if extract_to else None
+            if member.isdir():
+                if target:
+                    os.makedirs(target, exist_ok=True)
+            elif member.isfile():
+                source = archive.extractfile(member)
+                out = None
+                if target:
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    out = open(target, 'wb')
+                try:
+                    for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                        entry['size'] += len(chunk)
+                        if out:
+                            out.write(chunk)
+                finally:
+                    if out:
+                        out.close()
+                if entry['size'] != member.size:
+                    entry['ok'] = False
+                    entry['error'] = "размер не совпадает"
+            entry['seconds'] = time.perf_counter() - started
+            yield entry
+    except tarfile.TarError as e:
+        raise ValueError(f"Повреждённый tar: {e}") from e
+
+# ================== Источники данных ==================
+
+def iter_sources(sources: list, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Склеивает части архива в один поток. Источник - локальный путь или URL
+    (скачивается потоково через httpx, который уже есть в зависимостях PTB).
+    """
+    import httpx
+
+    for source in sources:
+        if os.path.isfile(source):
+            with open(source, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    yield chunk
+        else:
+            with httpx.stream("GET", source, timeout=60, follow_redirects=True) as response:
+                response.raise_for_status()
+                for chunk in response.iter_bytes(chunk_size):
+                    yield chunk
+
+# ================== Проверка и восстановление ==================
+
+def verify_or_restore(chunks: Iterable[bytes], key_for_salt: Callable[[bytes], bytes],
+                      extract_to: Optional[str] = None) -> dict:
+    """
+    Расшифровывает поток и проверяет zip (CRC каждой записи + тег GCM) или tar (тег GCM). Если задан
+    extract_to, файлы распаковываются в extract_to + '.partial', а папка переименовывается
+    в extract_to только после успешной проверки всего архива.
+    Память ограничена несколькими блоками CHUNK_SIZE независимо от размера архива.
+    """
+    started = time.perf_counter()
+    reader = DecryptingReader(chunks, key_for_salt)
+    staging = extract_to + ".partial" if extract_to else None
+    entries = []
+    report = {'entries': entries, 'ok': False, 'error': '', 'bytes': 0, 'seconds': 0.0}
+    try:
+        if staging:
+            os.makedirs(staging)
+        # Формат определяется по первым байтам: zip начинается с сигнатуры PK, иначе tar
+        stream = _PushbackReader(reader)
+        head = stream.read_exact(4)
+        stream.unread(head)
+        iter_entries = iter_zip_stream if head in (LOCAL_HEADER, END_OF_CENTRAL_DIR) else iter_tar_stream
+        for entry in iter_entries(stream, staging):
+            entries.append(entry)
+        # Центральный каталог не нужен, но тег GCM покрывает весь пакет
+        reader.finish()
+        report['ok'] = all(entry['ok'] for entry in entries)
+        if not report['ok']:
+            report['error'] = "Есть записи с ошибками"
+        elif staging:
+            os.replace(staging, extract_to)
+    except ValueError as e:
+        report['error'] = str(e) or "Ошибка проверки"
+    finally:
+        if staging and os.path.isdir(staging):
+            shutil.rmtree(staging, ignore_errors=True)
+        report['bytes'] = reader.ciphertext_bytes
+        report['seconds'] = time.perf_counter() - started
+    return report
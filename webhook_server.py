@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import hmac
+import json
+import re
+from http import HTTPStatus
+
+from telegram import Update
+from telegram.ext import Application
+
+# ================== Лёгкий асинхронный приёмник webhook ==================
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+MAX_HEADER_SIZE = 16 * 1024
+# Telegram не присылает обновления больше нескольких сотен КБ
+MAX_BODY_SIZE = 1024 * 1024
+KEEPALIVE_TIMEOUT = 60
+# Заголовки, определяющие границы тела: дубликаты позволили бы по-разному разобрать запрос
+FRAMING_HEADERS = ('content-length', 'transfer-encoding')
+_CONTENT_LENGTH_RE = re.compile(r'^[0-9]+$')
+
+
+class WebhookServer:
+    """
+    Минимальный HTTP/1.1 сервер на asyncio для приёма обновлений от Telegram.
+    Проверяет путь и секретный токен, кладёт Update в очередь приложения и
+    сразу отвечает 200 — обработка идёт в Application как и при polling.
+    """
+
+    def __init__(self, application: Application, listen: str, port: int, path: str,
+                 secret_token: str):
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token.encode('utf-8')
+        self._server = None
+        self._connections = set()
+        self._inflight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._closing = False
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.listen, self.port, limit=MAX_HEADER_SIZE
+        )
+        print(f"Webhook сервер слушает {self.listen}:{self.port}{self.path}")
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """
+        Останавливает приём: закрывает слушающий сокет, дожидается завершения
+        уже принятых запросов (чтобы Telegram не прислал их повторно), затем
+        закрывает оставшиеся keep-alive соединения.
+        """
+        if not self._server:
+            return
+        self._closing = True
+        self._server.close()
+        try:
+            await asyncio.wait_for(self._idle.wait(), drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Webhook: не дождались {self._inflight} запрос(ов) за {drain_timeout} сек")
+        for writer in list(self._connections):
+            writer.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections.add(writer)
+        try:
+            while not self._closing:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEPALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                        asyncio.TimeoutError, ConnectionError):
+                    break
+                keep_alive = await self._handle_request(head, reader, writer)
+                if not keep_alive:
+                    break
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _handle_request(self, head: bytes, reader, writer) -> bool:
+        """Обрабатывает один запрос. Возвращает True, если соединение можно переиспользовать."""
+        self._inflight += 1
+        self._idle.clear()
+        try:
+            try:
+                request_line, *header_lines = head.decode('latin-1').split("\r\n")
+                method, target, version = request_line.split(" ", 2)
+                headers = self._parse_headers(header_lines)
+            except ValueError:
+                await self._respond(writer, HTTPStatus.BAD_REQUEST, False)
+                return False
+
+            # Тело определяется только по Content-Length. Transfer-Encoding (chunked) не поддерживается:
+            # непрочитанные части остались бы в keep-alive соединении и были бы разобраны как следующий запрос
+            if 'transfer-encoding' in headers:
+                await self._respond(writer, HTTPStatus.BAD_REQUEST, False)
+                return False
+            if 'content-length' in headers:
+                if not _CONTENT_LENGTH_RE.match(headers['content-length']):
+                    await self._respond(writer, HTTPStatus.BAD_REQUEST, False)
+                    return False
+                length = int(headers['content-length'])
+            elif method == "POST":
+                await self._respond(writer, HTTPStatus.LENGTH_REQUIRED, False)
+                return False
+            else:
+                length = 0
+
+            keep_alive = version == "HTTP/1.1" and headers.get('connection', '').lower() != 'close'
+
+            if length > MAX_BODY_SIZE:
+                await self._respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, False)
+                return False
+            try:
+                body = await reader.readexactly(length)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return False
+
+            if target.split("?", 1)[0] != self.path:
+                status = HTTPStatus.NOT_FOUND
+            elif method != "POST":
+                status = HTTPStatus.METHOD_NOT_ALLOWED
+            elif not hmac.compare_digest(headers.get(SECRET_HEADER, '').encode('utf-8'), self.secret_token):
+                status = HTTPStatus.FORBIDDEN
+            else:
+                status = await self._enqueue(body)
+
+            keep_alive = keep_alive and not self._closing
+            await self._respond(writer, status, keep_alive)
+            return keep_alive
+        finally:
+            self._inflight -= 1
+            if not self._inflight:
+                self._idle.set()
+
+    @staticmethod
+    def _parse_headers(header_lines: list) -> dict:
+        """
+        Заголовки запроса {имя в нижнем регистре: значение}. ValueError - строка без ':',
+        пробел в имени или повторный Content-Length/Transfer-Encoding.
+        """
+        headers = {}
+        for line in header_lines:
+            if not line:
+                continue
+            name, sep, value = line.partition(":")
+            if not sep or not name or name != name.strip() or " " in name or "\t" in name:
+                raise ValueError(f"Неверный заголовок: {line!r}")
+            name = name.lower()
+            if name in FRAMING_HEADERS and name in headers:
+                raise ValueError(f"Повторный заголовок {name}")
+            headers[name] = value.strip()
+        return headers
+
+    async def _enqueue(self, body: bytes) -> HTTPStatus:
+        try:
+            data = json.loads(body)
+            update = Update.de_json(data, self.application.bot)
+        except Exception as e:
+            print(f"Webhook: некорректное обновление: {e}")
+            return HTTPStatus.BAD_REQUEST
+        await self.application.update_queue.put(update)
+        return HTTPStatus.OK
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: HTTPStatus, keep_alive: bool):
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Length: 0\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1')
+        )
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass